@@ -19,9 +19,11 @@
 import bpy
 import imp
 from bpy.props import (BoolProperty, StringProperty, IntProperty)
+from . import carver_profiler
 from . import carver_utils
 from . import carver_draw
 from . import carver_operator
+imp.reload(carver_profiler)
 imp.reload(carver_utils)
 imp.reload(carver_draw)
 imp.reload(carver_operator)
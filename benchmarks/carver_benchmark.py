@@ -0,0 +1,311 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Headless benchmark of the cut pipeline
+
+Run in background mode, the options come after "--" :
+
+    blender -b --factory-startup --python benchmarks/carver_benchmark.py -- --out results.json
+
+Synthetic slabs are stacked under an orthographic top view and cut thru with scripted mouse paths,
+using the same functions as the modal operator : cutter creation, Cut(), Rebool(), update_bevel()
+and Undo(). The time of each phase is written in JSON.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import importlib.util
+from types import SimpleNamespace
+
+import bpy
+import numpy as np
+from mathutils import Matrix
+
+
+# Load the add-on from the parent folder, whatever the name of the folder
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("simplecut", os.path.join(ADDON_DIR, "__init__.py"),
+                                              submodule_search_locations=[ADDON_DIR])
+simplecut = importlib.util.module_from_spec(spec)
+sys.modules["simplecut"] = simplecut
+spec.loader.exec_module(simplecut)
+
+from simplecut import carver_utils, carver_operator  # noqa: E402
+from simplecut.carver_profiler import profiler  # noqa: E402
+
+
+# Size of the fake region (pixels) and half size of the area it shows (world units)
+REGION_SIZE = 1000
+VIEW_EXTENT = 1.5
+
+
+class BenchOperator:
+    """ Stand-in for the modal operator : the state read by Cut() and the cut functions """
+
+    CARVER = carver_operator.CARVER_OT_operator
+    Cut = CARVER.Cut
+
+    def __init__(self, shape, segments):
+        # Operator properties with their default values
+        for name, prop in getattr(self.CARVER, "__annotations__", {}).items():
+            keywords = prop[1] if isinstance(prop, tuple) else getattr(prop, "keywords", {})
+            setattr(self, name, keywords.get("default"))
+
+        # Same runtime state as the operator
+        carver_utils.init_cut_state(self)
+
+        self.CutterShape = {"rectangle": 0, "polygon": 1, "circle": 2}[shape]
+        self.segments = segments
+
+        self.CreateMode = False
+        self.CutMode = True
+        self.shift = False
+
+    def report(self, type, message):
+        print("[Carver] " + ", ".join(type) + " : " + message)
+
+
+def fake_view_context():
+    """ Context of an orthographic top view, enough for the projection of the cutter """
+    view_matrix = Matrix.Translation((0.0, 0.0, -50.0))
+    projection = Matrix.Diagonal((1.0 / VIEW_EXTENT, 1.0 / VIEW_EXTENT, -0.01, 1.0))
+
+    region = SimpleNamespace(type='WINDOW', x=0, y=0, width=REGION_SIZE, height=REGION_SIZE)
+    overlay = SimpleNamespace(grid_scale=1.0, grid_subdivisions=10)
+    area = SimpleNamespace(type='VIEW_3D', x=0, y=0, width=REGION_SIZE, height=REGION_SIZE,
+                           regions=[region], spaces=SimpleNamespace(active=SimpleNamespace(overlay=overlay)))
+    region_data = SimpleNamespace(is_perspective=False, view_matrix=view_matrix,
+                                  perspective_matrix=projection @ view_matrix)
+
+    return SimpleNamespace(area=area, region=region, region_data=region_data,
+                           scene=bpy.context.scene, collection=bpy.context.scene.collection)
+
+
+def slab_mesh(name, faces, size=2.0, thickness=0.2):
+    """ Closed box of about faces faces, its top and bottom are grids """
+    n = max(1, int(round(math.sqrt(faces / 2.0))))
+    side = n + 1
+
+    # Top grid then bottom grid
+    xy = np.linspace(-size / 2.0, size / 2.0, side)
+    gx, gy = np.meshgrid(xy, xy)
+    grid = np.column_stack((gx.ravel(), gy.ravel()))
+    co = np.zeros((2 * side * side, 3))
+    co[:, :2] = np.tile(grid, (2, 1))
+    co[:side * side, 2] = thickness / 2.0
+    co[side * side:, 2] = -thickness / 2.0
+
+    # Quads of the top grid, counter clockwise seen from above
+    i, j = np.meshgrid(np.arange(n), np.arange(n))
+    v0 = (j * side + i).ravel()
+    top = np.column_stack((v0, v0 + 1, v0 + side + 1, v0 + side))
+    bottom = top[:, ::-1] + side * side
+
+    # Border of the grid, counter clockwise seen from above, and the side quads
+    k = np.arange(n)
+    border = np.concatenate((k, n + k * side, side * side - 1 - k, (n - k) * side))
+    nxt = np.roll(border, -1)
+    sides = np.column_stack((border, border + side * side, nxt + side * side, nxt))
+
+    loops = np.concatenate((top, bottom, sides)).astype(np.int32).ravel()
+    count = len(loops) // 4
+
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(len(co))
+    me.vertices.foreach_set("co", co.astype(np.float32).ravel())
+    me.loops.add(len(loops))
+    me.loops.foreach_set("vertex_index", loops)
+    me.polygons.add(count)
+    me.polygons.foreach_set("loop_start", np.arange(0, len(loops), 4, dtype=np.int32))
+    me.polygons.foreach_set("loop_total", np.full(count, 4, dtype=np.int32))
+    me.update(calc_edges=True)
+    return me
+
+
+def clear_scene():
+    for ob in list(bpy.data.objects):
+        bpy.data.objects.remove(ob, do_unlink=True)
+    for me in list(bpy.data.meshes):
+        if me.users == 0:
+            bpy.data.meshes.remove(me)
+
+
+def build_scene(faces, objects):
+    """ Stack of slabs under the view, all selected, with a bevel modifier """
+    clear_scene()
+    me = slab_mesh("BenchSlab", faces)
+    targets = []
+    for i in range(objects):
+        ob = bpy.data.objects.new("BenchTarget", me if i == 0 else me.copy())
+        ob.location = (0.0, 0.0, -0.5 * i)
+        ob.modifiers.new("Bevel", 'BEVEL').limit_method = 'WEIGHT'
+        bpy.context.scene.collection.objects.link(ob)
+        ob.select_set(True)
+        targets.append(ob)
+    bpy.context.view_layer.objects.active = targets[0]
+    bpy.context.view_layer.update()
+    return targets
+
+
+def set_mouse_path(op, shape, segments):
+    """ Scripted mouse path of the cutter, around the center of the region """
+    c = REGION_SIZE / 2.0
+    r = REGION_SIZE * 0.15
+
+    if shape == "rectangle":
+        x0, y0, x1, y1 = c - r, c - r * 0.5, c + r, c + r * 0.5
+        op.mouse_path = [(x0, y0), (x1, y1)]
+        op.rectangle_coord = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+    elif shape == "polygon":
+        # Star, every other point on a smaller radius
+        angles = np.linspace(0.0, 2.0 * math.pi, segments, endpoint=False)
+        radius = np.where(np.arange(segments) % 2, r * 0.5, r)
+        op.mouse_path = [(float(x), float(y)) for x, y in
+                         zip(c + radius * np.cos(angles), c + radius * np.sin(angles))]
+
+    else:
+        # Closest available subdivision
+        counts = [360 // a for a in op.stepAngle]
+        op.step = min(range(len(counts)), key=lambda i: abs(counts[i] - segments))
+        op.mouse_path = [(c, c), (c + r, c)]
+
+
+def create_cutter(op, context, shape):
+    if shape == "rectangle":
+        carver_utils.CreateRectangleCutterMesh(op, context)
+    elif shape == "polygon":
+        carver_utils.CreateCutLine(op, context)
+    else:
+        carver_utils.CreateCircleCutterMesh(op, context)
+
+
+def timed(phases, name, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    phases.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def add_breakdown(phases, prefix):
+    """ Add the phases of the last cut measured by the profiler """
+    name, duration, totals, args = profiler.breakdown()
+    for child, child_duration in totals.items():
+        phases.setdefault(prefix + "/" + child, []).append(child_duration)
+
+
+def run_case(faces, objects, shape, segments):
+    """ Time one repeat of the phases of a case """
+    phases = {}
+    context = fake_view_context()
+
+    targets = timed(phases, "scene", build_scene, faces, objects)
+
+    # Difference cut, then undo it
+    op = BenchOperator(shape, segments)
+    timed(phases, "bevel_full", carver_utils.update_bevel, bpy.context, targets, op.beveled_meshes)
+    op.OpsObj = targets[0]
+    set_mouse_path(op, shape, segments)
+    timed(phases, "cutter", create_cutter, op, context, shape)
+    timed(phases, "cut", op.Cut)
+    add_breakdown(phases, "cut")
+    carver_utils.UndoListUpdate(op)
+    timed(phases, "undo", carver_utils.Undo, op)
+    add_breakdown(phases, "undo")
+
+    # Rebool cut, the inside part of each target goes to a new object
+    op.shift = True
+    op.CutMode = True
+    set_mouse_path(op, shape, segments)
+    create_cutter(op, context, shape)
+    timed(phases, "rebool", op.Cut)
+    add_breakdown(phases, "rebool")
+    op.cutter_pool.clear()
+
+    return phases
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="SimpleCut headless benchmark")
+    parser.add_argument("--out", help="JSON file, printed when not given")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1000, 20000, 200000, 2000000])
+    parser.add_argument("--objects", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--shapes", nargs="+", default=["rectangle", "polygon", "circle"],
+                        choices=["rectangle", "polygon", "circle"])
+    parser.add_argument("--segments", type=int, nargs="+", default=[8, 72],
+                        help="Points of the polygon / subdivisions of the circle")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--trace", help="Chrome trace file of all the cuts")
+    parser.add_argument("--max-total-faces", type=int, default=4000000,
+                        help="Skip the cases with more faces in all the objects")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    cases = []
+
+    for faces in args.faces:
+        for objects in args.objects:
+            if faces * objects > args.max_total_faces:
+                continue
+            for shape in args.shapes:
+                for segments in (args.segments if shape != "rectangle" else [4]):
+                    samples = {}
+                    for i in range(args.repeat):
+                        for name, values in run_case(faces, objects, shape, segments).items():
+                            samples.setdefault(name, []).extend(values)
+                    clear_scene()
+
+                    case = {
+                        "faces": faces,
+                        "objects": objects,
+                        "shape": shape,
+                        "segments": segments,
+                        "phases": {name: {"min": min(v), "median": float(np.median(v)), "samples": v}
+                                   for name, v in samples.items()},
+                    }
+                    cases.append(case)
+                    print("[Carver] " + shape + " " + str(segments) + ", " + str(objects) + " x " +
+                          str(faces) + " faces : " +
+                          ", ".join(name + " " + "%.3f" % p["min"] for name, p in case["phases"].items()))
+
+    result = {
+        "blender": bpy.app.version_string,
+        "background": bpy.app.background,
+        "repeat": args.repeat,
+        "cases": cases,
+    }
+
+    if args.trace:
+        profiler.export(args.trace)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,9 @@ from gpu_extras.batch import batch_for_shader
 from math import (cos, sin, ceil, floor)
 from mathutils import (Color, Euler, Vector, Quaternion)
 
-from .carver_utils import (draw_circle, draw_shader, objDiagonal, mini_grid)
+from .carver_utils import (draw_circle, draw_shader, objDiagonal, mini_grid, get_array_preview,
+                           get_view_context, region_coords)
+from .carver_profiler import profiler
 
 
 def get_text_info(self, context, help_txt):
@@ -38,60 +40,23 @@ def get_text_info(self, context, help_txt):
     return(help_txt, bloc_height, max_option, max_key, comma)
 
 
-def draw_string(self, color1, color2, left, bottom, text, max_option, divide=1):
-    """ Draw the text like 'option : key' or just 'option' """
-
-    font_id = 0
-    ui_scale = bpy.context.preferences.system.ui_scale
-
-    blf.enable(font_id, blf.SHADOW)
-    blf.shadow(font_id, 0, 0.0, 0.0, 0.0, 1.0)
-    blf.shadow_offset(font_id, 2, -2)
-    line_height = (blf.dimensions(font_id, "gM")[1] * 1.45)
-    y_offset = 5
-
-    #  Test if the text is a list formatted like : ('option', 'key')
-    if isinstance(text, list):
-        spacer_text = " : "
-        spacer_width = blf.dimensions(font_id, spacer_text)[0]
-        for string in text:
-            blf.position(font_id, (left), (bottom + y_offset), 0)
-            blf.color(font_id, *color1)
-            blf.draw(font_id, string[0])
-            blf.position(font_id, (left + max_option), (bottom + y_offset), 0)
-            blf.draw(font_id, spacer_text)
-            blf.color(font_id, *color2)
-            blf.position(font_id, (left + max_option + spacer_width), (bottom + y_offset), 0)
-            blf.draw(font_id, string[1])
-            y_offset += line_height
-    else:
-        #  The text is formatted like : ('option')
-        blf.position(font_id, left, (bottom + y_offset), 0)
-        blf.color(font_id, *color1)
-        blf.draw(font_id, text)
-        y_offset += line_height
-
-    blf.disable(font_id, blf.SHADOW)
-
-
-def draw_callback_px(self, context):
-    """Opengl draw on screen"""
-    font_id = 0
+def get_hud_layout(self, context):
+    """ Return the position of the texts and the separator, rebuilt only when the displayed state changes """
     region = context.region
-    UIColor = (0.992, 0.5518, 0.0, 1.0)
+    ui_scale = context.preferences.system.ui_scale
 
     #  Cut Type
-    RECTANGLE = 0
     LINE = 1
     CIRCLE = 2
+    LASSO = 3
 
-    #  Color
-    color1 = (1.0, 1.0, 1.0, 1.0)
-    color2 = UIColor
-
-    # The mouse is outside the active region
-    if not self.in_view_3d:
-        color1 = color2 = (1.0, 0.2, 0.1, 1.0)
+    key = (self.CutterShape, self.CreateMode, self.Closed, self.snapCursor, self.dont_apply_boolean,
+           self.deferred_apply, self.Auto_BevelUpdate, self.step, self.shift, region.width, ui_scale,
+           self.show_profile and profiler.serial, self.array_mode, self.array_count, self.mirror_mode,
+           self.multi_shape, len(self.shape_queue))
+    layout = self.hud_layouts.get(key)
+    if layout is not None:
+        return layout
 
     #  Primitives type
     PrimitiveType = "Rectangle"
@@ -99,15 +64,8 @@ def draw_callback_px(self, context):
         PrimitiveType = "Circle"
     if self.CutterShape == LINE:
         PrimitiveType = "Line"
-
-    #  Width screen
-    overlap = context.preferences.system.use_region_overlap
-
-    t_panel_width = 0
-    if overlap:
-        for region in context.area.regions:
-            if region.type == 'TOOLS':
-                t_panel_width = region.width
+    if self.CutterShape == LASSO:
+        PrimitiveType = "Lasso"
 
     #  Initial position
     region_width = int(region.width / 2.0)
@@ -116,9 +74,8 @@ def draw_callback_px(self, context):
     #  Draw the center command from bottom to top
 
     #  Get the size of the text
-    text_size = 18 if region.width >= 850 else 12
-    ui_scale = bpy.context.preferences.system.ui_scale
-    blf.size(0, round(text_size * ui_scale), 72)
+    text_size = round((18 if region.width >= 850 else 12) * ui_scale)
+    blf.size(0, text_size, 72)
 
     #  Depth Cursor
     TypeStr = "Cursor Depth [" + 'D' + "]"
@@ -137,11 +94,34 @@ def draw_callback_px(self, context):
         BoolStr = "(OFF)" if self.dont_apply_boolean else "(ON)"
         help_txt += [[TypeStr, BoolStr]]
 
+        #  Apply the booleans when leaving
+        TypeStr = "Deferred Apply [" + 'F' + "]"
+        BoolStr = "(ON)" if self.deferred_apply else "(OFF)"
+        help_txt += [[TypeStr, BoolStr]]
+
+        #  Queue the shapes, cut them with Enter
+        TypeStr = "Multi Shape [" + 'S' + "]"
+        BoolStr = "(ON)" if self.multi_shape else "(OFF)"
+        if self.shape_queue:
+            BoolStr += " " + str(len(self.shape_queue)) + " [Enter]"
+        help_txt += [[TypeStr, BoolStr]]
+
         # Auto update for bevel
         TypeStr = "Bevel Update [" + 'A' + "]"
         BoolStr = "(ON)" if self.Auto_BevelUpdate else "(OFF)"
         help_txt += [[TypeStr, BoolStr]]
 
+    #  Array and mirror of the cutter
+    TypeStr = "Array [" + 'R' + "][" + '+' + "][" + '-' + "]"
+    BoolStr = self.array_modes[self.array_mode]
+    if self.array_mode:
+        BoolStr += " " + str(self.array_count)
+    help_txt += [[TypeStr, BoolStr]]
+
+    TypeStr = "Mirror [" + 'M' + "]"
+    BoolStr = self.mirror_modes[self.mirror_mode][0]
+    help_txt += [[TypeStr, BoolStr]]
+
     #  Circle subdivisions
     if self.CutterShape == CIRCLE:
         TypeStr = "Subdivisions [" + 'W' + "][" + 'X' + "]"
@@ -155,17 +135,23 @@ def draw_callback_px(self, context):
 
     help_txt, bloc_height, max_option, max_key, comma = get_text_info(self, context, help_txt)
     xCmd = region_width - (max_option + max_key + comma) / 2
-    draw_string(self, color1, color2, xCmd, y_txt, help_txt, max_option, divide=2)
 
-    #  Separator (Line)
-    LineWidth = (max_option + max_key + comma) / 2
-    if region.width >= 850:
-        LineWidth = 140
+    # Each text is stored as (size, x, y, text, color index)
+    texts = []
+    line_height = (blf.dimensions(0, "gM")[1] * 1.45)
+    spacer_text = " : "
+    spacer_width = blf.dimensions(0, spacer_text)[0]
+    y_offset = 5
+    for option, value in help_txt:
+        texts.append((text_size, xCmd, y_txt + y_offset, option, 0))
+        texts.append((text_size, xCmd + max_option, y_txt + y_offset, spacer_text, 0))
+        texts.append((text_size, xCmd + max_option + spacer_width, y_txt + y_offset, value, 1))
+        y_offset += line_height
 
+    #  Separator (Line)
     LineWidth = (max_option + max_key + comma)
-    coords = [(int(region_width - LineWidth/2), y_txt + bloc_height + 8),
-              (int(region_width + LineWidth/2), y_txt + bloc_height + 8)]
-    draw_shader(self, UIColor, 1, 'LINES', coords, 1)
+    separator = [(int(region_width - LineWidth/2), y_txt + bloc_height + 8),
+                 (int(region_width + LineWidth/2), y_txt + bloc_height + 8)]
 
     #  Command Display
     if self.CreateMode:
@@ -175,13 +161,87 @@ def draw_callback_px(self, context):
             "Difference" if (self.shift is False) else "Rebool"
 
     #  Display boolean mode
-    text_size = 40 if region.width >= 850 else 20
-    blf.size(0, round(text_size * ui_scale), 72)
+    mode_size = round((40 if region.width >= 850 else 20) * ui_scale)
+    blf.size(0, mode_size, 72)
+    texts.append((mode_size, region_width - (blf.dimensions(0, BooleanMode)[0]) / 2,
+                  y_txt + bloc_height + 16 + 5, BooleanMode, 1))
+
+    #  Timings of the last cut
+    if self.show_profile:
+        mode_height = blf.dimensions(0, BooleanMode)[1]
+        ProfileStr = "Timings [P] : " + profiler.summary_text()
+        blf.size(0, text_size, 72)
+        texts.append((text_size, region_width - (blf.dimensions(0, ProfileStr)[0]) / 2,
+                      y_txt + bloc_height + 16 + 5 + mode_height + 12, ProfileStr, 0))
+
+    # Several 3D views can be drawn with different widths, keep a few layouts
+    if len(self.hud_layouts) > 16:
+        self.hud_layouts.clear()
+    layout = (texts, separator)
+    self.hud_layouts[key] = layout
+    return layout
+
+
+def draw_hud_text(texts, color1, color2):
+    """ Draw the texts of the layout """
+    font_id = 0
+    colors = (color1, color2)
+
+    blf.enable(font_id, blf.SHADOW)
+    blf.shadow(font_id, 0, 0.0, 0.0, 0.0, 1.0)
+    blf.shadow_offset(font_id, 2, -2)
+
+    size = None
+    for text_size, x, y, text, color in texts:
+        if text_size != size:
+            size = text_size
+            blf.size(font_id, size, 72)
+        blf.position(font_id, x, y, 0)
+        blf.color(font_id, *colors[color])
+        blf.draw(font_id, text)
+
+    blf.disable(font_id, blf.SHADOW)
+
+
+def draw_callback_px(self, context):
+    """Opengl draw on screen"""
+    # Only draw in the region where the operator is used
+    if context.region != self.view_region:
+        return
+
+    UIColor = (0.992, 0.5518, 0.0, 1.0)
+
+    #  Cut Type
+    RECTANGLE = 0
+    LINE = 1
+    CIRCLE = 2
+    LASSO = 3
+
+    #  Color
+    color1 = (1.0, 1.0, 1.0, 1.0)
+    color2 = UIColor
+
+    # The mouse is outside the active region
+    if not self.in_view_3d:
+        color1 = color2 = (1.0, 0.2, 0.1, 1.0)
 
-    draw_string(self, color2, color2, region_width - (blf.dimensions(0, BooleanMode)[0]) / 2,
-                y_txt + bloc_height + 16, BooleanMode, 0, divide=2)
+    #  Replay the cached text layout
+    texts, separator = get_hud_layout(self, context)
+    draw_hud_text(texts, color1, color2)
+    draw_shader(self, UIColor, 1, 'LINES', separator, 1)
+
+    #  Queued shapes
+    if self.shape_queue:
+        view = get_view_context(self, context)
+        for islands in self.shape_queue:
+            for co, direction in islands:
+                queue_coords = region_coords(view, co)
+                if queue_coords is not None:
+                    draw_shader(self, UIColor, 1.0, 'LINE_LOOP', queue_coords, size=1)
 
     if self.CutMode:
+        # Outline of the shape, for the preview of its copies
+        shape_coords = None
 
         if len(self.mouse_path) > 1:
             x0 = self.mouse_path[0][0]
@@ -198,6 +258,7 @@ def draw_callback_px(self, context):
             indices = ((0, 1, 2), (2, 0, 3))
 
             self.rectangle_coord = coords
+            shape_coords = coords
 
             draw_shader(self, UIColor, 1, 'LINE_LOOP', coords, size=1)
 
@@ -221,6 +282,8 @@ def draw_callback_px(self, context):
                 coords.append([vals[0] + self.xpos, vals[1] + self.ypos])
                 indices.append([idx])
 
+            shape_coords = coords
+
             #  Draw lines
             if self.Closed:
                 draw_shader(self, UIColor, 1.0, 'LINE_LOOP', coords, size=1)
@@ -238,6 +301,18 @@ def draw_callback_px(self, context):
             if self.ctrl:
                 mini_grid(self, context, UIColor)
 
+        #  Lasso Cut
+        elif self.CutterShape == LASSO:
+            coords = [(x + self.xpos, y + self.ypos) for x, y in self.mouse_path]
+            shape_coords = coords
+
+            #  Draw the path closed on its first point
+            draw_shader(self, UIColor, 1.0, 'LINE_LOOP', coords, size=1)
+
+            #  Draw polygon
+            if self.shift or self.CreateMode:
+                draw_shader(self, UIColor, 0.5, 'TRI_FAN', coords, size=1)
+
         #  Circle Cut
         elif self.CutterShape == CIRCLE:
             #  Create a circle using a tri fan
@@ -245,11 +320,17 @@ def draw_callback_px(self, context):
 
             #  Remove the vertex in the center to get the outer line of the circle
             line_coords = tris_coords[1:]
+            shape_coords = line_coords
             draw_shader(self, UIColor, 1.0, 'LINE_LOOP', line_coords, size=1)
 
             if self.shift or self.CreateMode:
                 draw_shader(self, UIColor, 0.5, 'TRIS', tris_coords, size=1, indices=indices)
 
+        #  Copies of the array and the mirror
+        if shape_coords is not None:
+            for copy_coords in get_array_preview(self, context, shape_coords):
+                draw_shader(self, UIColor, 0.5, 'LINE_LOOP', copy_coords, size=1)
+
     #  Opengl defaults
     bgl.glLineWidth(1)
     bgl.glDisable(bgl.GL_BLEND)
@@ -1,8 +1,11 @@
 import bpy
 import bpy_extras
+import os
 import sys
+import time
 from bpy.props import (
     BoolProperty,
+    FloatProperty,
     IntProperty,
     PointerProperty,
     StringProperty,
@@ -27,17 +30,35 @@ from .carver_utils import (
     objDiagonal,
     Undo,
     UndoAdd,
+    UndoDiscardUnchanged,
     CreateRectangleCutterMesh,
     CreateCircleCutterMesh,
     CreateCutLine,
+    apply_modifiers,
+    flush_apply_queue,
+    drop_apply_queue,
     boolean_operation,
+    build_cutter_islands,
+    get_array_islands,
+    union_cutter,
+    islands_overlap,
+    init_cut_state,
+    remove_object,
     update_bevel,
     CreateBevel,
     Rebool,
     Snap_Cursor,
+    Snap_Path,
+    add_lasso_point,
+    set_mesh_selection,
+    cutter_hits_object,
+    get_cutter_depth,
+    get_view_context,
+    update_view_grid,
 )
 
 from .carver_draw import draw_callback_px
+from .carver_profiler import profiler
 
 
 class CARVER_OT_operator(bpy.types.Operator):
@@ -47,9 +68,49 @@ class CARVER_OT_operator(bpy.types.Operator):
     bl_description = "Cut or create Meshes in Object mode"
     bl_options = {'REGISTER', 'UNDO'}
 
+    undo_memory_limit: IntProperty(
+        name="Undo Memory Limit",
+        description="Memory (in MB) kept for the undo steps of the session, "
+                    "the oldest steps are freed when it is exceeded",
+        default=1024,
+        min=16,
+    )
+    undo_compress: BoolProperty(
+        name="Compress Undo",
+        description="Compress the undo steps, slower but uses less memory",
+        default=False,
+    )
+    simplify_tolerance: FloatProperty(
+        name="Simplify Tolerance",
+        description="Distance in pixels under which the points of a polygon cutter are removed",
+        default=1.0,
+        min=0.0,
+    )
+    lasso_tolerance: FloatProperty(
+        name="Lasso Tolerance",
+        description="Distance in pixels under which the points of a lasso cutter are removed while drawing",
+        default=3.0,
+        min=0.0,
+    )
+    max_redraw_rate: IntProperty(
+        name="Max Redraw Rate",
+        description="Maximum number of redraws per second of the overlay",
+        default=60,
+        min=1,
+    )
+    trace_path: StringProperty(
+        name="Trace File",
+        description="Chrome trace file written with Ctrl+P, in the temporary folder when empty",
+        default="",
+        subtype='FILE_PATH',
+    )
+
     def __init__(self):
         context = bpy.context
 
+        # State of the cuts, shared with the benchmark
+        init_cut_state(self)
+
         self.CutMode = False
         self.CreateMode = False
 
@@ -59,56 +120,33 @@ class CARVER_OT_operator(bpy.types.Operator):
             self.ExclusiveCreateMode = True
             self.CreateMode = True
 
-        # Selected type of cut
-        self.CutterShape = 0
-
-        # Cut type (Rectangle, Circle, Line)
-        self.rectangle = 0
-        self.polygon = 1
-        self.circle = 2
-
-        # Cut Rectangle coordinates
-        self.rectangle_coord = []
-
         self.CurrentSelection = context.selected_objects.copy()
         self.CurrentActive = context.active_object
         self.all_sel_obj_list = context.selected_objects.copy()
-        self.save_active_obj = None
+
+        # Region where the operator is used, the only one drawn and redrawn
+        self.view_region = context.region
+
+        # Redraw scheduler
+        self.redraw_state = None
+        self.redraw_time = 0.0
+        self.redraw_pending = False
+        self._timer = None
 
         args = (self, context)
         self._handle = bpy.types.SpaceView3D.draw_handler_add(draw_callback_px, args, 'WINDOW', 'POST_PIXEL')
 
-        self.mouse_path = [(0, 0), (0, 0)]
+        # Text layouts of the HUD, by displayed state
+        self.hud_layouts = {}
 
         # Keyboard event
         self.shift = False
         self.ctrl = False
         self.alt = False
 
-        self.dont_apply_boolean = False
-        self.Auto_BevelUpdate = True
-
-        # Circle variables
-        self.stepAngle = [2, 4, 5, 6, 9, 10, 15, 20, 30, 40, 45, 60, 72, 90]
-        self.step = 4
-
-        # Primitives Position
-        self.xpos = 0
-        self.ypos = 0
-        self.InitPosition = False
-
-        # Close polygonal shape
-        self.Closed = True
-
-        # Depth Cursor
-        self.snapCursor = False
-
         # Working object
         self.OpsObj = context.active_object
 
-        self.ViewVector = Vector()
-        self.CurrentObj = None
-
         # Mouse region
         self.mouse_region = -1, -1
 
@@ -144,44 +182,78 @@ class CARVER_OT_operator(bpy.types.Operator):
         if context.mode == 'EDIT_MESH':
             bpy.ops.object.mode_set(mode='OBJECT')
 
-        # Undo Variables
-        self.UList = []
-        self.UList_Index = -1
-        self.UndoOps = []
-
         context.window_manager.modal_handler_add(self)
 
         return {'RUNNING_MODAL'}
 
     def modal(self, context, event):
+        result = self.modal_event(context, event)
 
-        region_types = {'WINDOW', 'UI'}
-        win = context.window
+        if 'FINISHED' in result:
+            # Clear the overlay
+            self.remove_redraw_timer(context)
+            self.view_region.tag_redraw()
+        else:
+            self.schedule_redraw(context)
+
+        return result
+
+    def overlay_state(self):
+        """Everything the overlay depends on"""
+        return (tuple(self.mouse_path), self.xpos, self.ypos, self.CutMode, self.CutterShape,
+                self.shift, self.ctrl, self.in_view_3d, self.snapCursor, self.dont_apply_boolean,
+                self.deferred_apply, self.Auto_BevelUpdate, self.Closed, self.step, self.UList_Index,
+                self.show_profile, profiler.serial,
+                self.array_mode, self.array_count, self.mirror_mode,
+                self.multi_shape, len(self.shape_queue))
+
+    def schedule_redraw(self, context):
+        """Redraw the working region when the overlay changed, no more than max_redraw_rate times per second"""
+        state = self.overlay_state()
+        if state != self.redraw_state:
+            self.redraw_state = state
+            self.redraw_pending = True
+
+        if not self.redraw_pending:
+            return
+
+        now = time.perf_counter()
+        if now - self.redraw_time >= 1.0 / self.max_redraw_rate:
+            self.view_region.tag_redraw()
+            self.redraw_time = now
+            self.redraw_pending = False
+            self.remove_redraw_timer(context)
+        elif self._timer is None:
+            # Come back when the next frame is allowed
+            self._timer = context.window_manager.event_timer_add(
+                1.0 / self.max_redraw_rate, window=context.window)
+
+    def remove_redraw_timer(self, context):
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+
+    def modal_event(self, context, event):
 
         # Find the limit of the view3d region
         self.check_region(context, event)
 
-        for area in win.screen.areas:
-            if area.type == 'VIEW_3D':
-                for region in area.regions:
-                    if not region_types or region.type in region_types:
-                        region.tag_redraw()
-
         # Change the snap increment value using the wheel mouse
         if self.CutMode:
             if self.alt is False:
                 if self.ctrl and (self.CutterShape in (self.polygon, self.rectangle)):
-                    # Get the VIEW3D area
-                    for i, a in enumerate(context.screen.areas):
-                        if a.type == 'VIEW_3D':
-                            space = context.screen.areas[i].spaces.active
-                    grid_scale = space.overlay.grid_scale
-                    grid_subdivisions = space.overlay.grid_subdivisions
-
-                    if event.type == 'WHEELUPMOUSE':
-                        space.overlay.grid_subdivisions += 1
-                    elif event.type == 'WHEELDOWNMOUSE':
-                        space.overlay.grid_subdivisions -= 1
+                    # Get the VIEW3D space
+                    space = get_view_context(self, context).space
+
+                    if event.type in {'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
+                        if event.type == 'WHEELUPMOUSE':
+                            space.overlay.grid_subdivisions += 1
+                        else:
+                            space.overlay.grid_subdivisions -= 1
+                        update_view_grid(self)
+
+                        # Move the points already placed on the new grid
+                        Snap_Path(self, context)
 
         if event.type in {'MIDDLEMOUSE', 'SPACE'}:
             return {'PASS_THROUGH'}
@@ -234,7 +306,12 @@ class CARVER_OT_operator(bpy.types.Operator):
                         # Enable cut mode
                         self.CutMode = True
 
-                        if self.CutterShape is not self.polygon:
+                        if self.CutterShape is self.lasso:
+                            # Start recording the lasso path
+                            self.mouse_path.clear()
+                            self.mouse_path.append((event.mouse_region_x, event.mouse_region_y))
+                            self.lasso_skipped.clear()
+                        elif self.CutterShape is not self.polygon:
                             # Start drawing cutter shape
                             self.mouse_path[0] = (event.mouse_region_x, event.mouse_region_y)
                             self.mouse_path[1] = (event.mouse_region_x, event.mouse_region_y)
@@ -249,27 +326,33 @@ class CARVER_OT_operator(bpy.types.Operator):
                         if MouseNearStartPoint is True:
                             # If mouse is close to first point, create the polygon cutter
                             CreateCutLine(self, context)
-                            self.Cut()
-                            UndoListUpdate(self)
+                            self.queue_or_cut(context)
                         else:
                             # Otherwise, add another polygon shape point
                             self.mouse_path.append((event.mouse_region_x, event.mouse_region_y))
 
                 elif event.value == 'RELEASE':
-                    if self.CutMode is True and self.CutterShape is not self.polygon:
+                    if self.CutMode is True and self.CutterShape is self.lasso and len(self.mouse_path) < 3:
+                        # Not enough points to close the lasso
+                        self.CutMode = False
+                        self.mouse_path = [(0, 0), (0, 0)]
+
+                    elif self.CutMode is True and self.CutterShape is not self.polygon:
                         # Cut creation
                         if self.CutterShape == self.rectangle:
                             CreateRectangleCutterMesh(self, context)
                         if self.CutterShape == self.circle:
                             CreateCircleCutterMesh(self, context)
+                        if self.CutterShape == self.lasso:
+                            CreateCutLine(self, context)
 
                         if self.CreateMode:
                             self.CreateGeometry()  # Create object from cutter mesh
+                            self.cutter_pool.clear()
                             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
                             return {'FINISHED'}
                         else:
-                            self.Cut()  # Cut the selected object using cutter mesh
-                            UndoListUpdate(self)
+                            self.queue_or_cut(context)  # Cut the selected object using cutter mesh
 
             # Mouse move
             if event.type == 'MOUSEMOVE' and self.CutMode is True:
@@ -280,6 +363,9 @@ class CARVER_OT_operator(bpy.types.Operator):
 
                     self.last_mouse_region_x = event.mouse_region_x
                     self.last_mouse_region_y = event.mouse_region_y
+                elif self.CutterShape is self.lasso:
+                    # Record the lasso path
+                    add_lasso_point(self, (event.mouse_region_x, event.mouse_region_y))
                 else:
                     if self.ctrl:
                         # Snap mouse position to the cursor
@@ -295,13 +381,53 @@ class CARVER_OT_operator(bpy.types.Operator):
                 if self.CutMode is False:
                     # Cut Mode
                     self.CutterShape += 1
-                    if self.CutterShape > 2:
+                    if self.CutterShape > self.lasso:
                         self.CutterShape = 0
 
             # Apply boolean
             if event.type == 'Q' and event.value == 'PRESS':
                 self.dont_apply_boolean = not self.dont_apply_boolean
 
+            # Deferred apply of the booleans
+            if event.type == 'F' and event.value == 'PRESS':
+                self.deferred_apply = not self.deferred_apply
+
+            # Array of the cutter
+            if event.type == 'R' and event.value == 'PRESS':
+                self.array_mode = (self.array_mode + 1) % len(self.array_modes)
+
+            if event.type in {'NUMPAD_PLUS', 'EQUAL'} and event.value == 'PRESS':
+                self.array_count = min(self.array_count + 1, 64)
+
+            if event.type in {'NUMPAD_MINUS', 'MINUS'} and event.value == 'PRESS':
+                self.array_count = max(self.array_count - 1, 2)
+
+            # Mirror of the cutter
+            if event.type == 'M' and event.value == 'PRESS':
+                self.mirror_mode = (self.mirror_mode + 1) % len(self.mirror_modes)
+
+            # Multi shape
+            if event.type == 'S' and event.value == 'PRESS' and self.CreateMode is False:
+                self.multi_shape = not self.multi_shape
+
+            # Cut with the queued shapes
+            if event.type in {'RET', 'NUMPAD_ENTER'} and event.value == 'PRESS':
+                self.commit_shape_queue(context)
+
+            # Timings of the last cut, Ctrl : export the trace of the session
+            if event.type == 'P' and event.value == 'PRESS':
+                if self.ctrl:
+                    path = bpy.path.abspath(self.trace_path) if self.trace_path else \
+                        os.path.join(bpy.app.tempdir, "carver_trace.json")
+                    try:
+                        profiler.export(path)
+                        self.report({'INFO'}, "Carver trace written to " + path)
+                    except OSError as e:
+                        # The carve session goes on
+                        self.report({'WARNING'}, "Carver trace not written : " + str(e))
+                else:
+                    self.show_profile = not self.show_profile
+
             # Cursor depth or solidify pattern
             if event.type == 'D' and event.value == 'PRESS':
                 self.snapCursor = not self.snapCursor
@@ -312,6 +438,11 @@ class CARVER_OT_operator(bpy.types.Operator):
                     if (self.CutterShape == self.polygon) and (self.CutMode):
                         if len(self.mouse_path) > 1:
                             self.mouse_path[len(self.mouse_path) - 1:] = []
+                    elif self.shape_queue:
+                        # Remove the last queued shape
+                        self.shape_queue.pop()
+                        if not self.shape_queue:
+                            self.clear_shape_queue()
                     else:
                         Undo(self)
 
@@ -334,6 +465,10 @@ class CARVER_OT_operator(bpy.types.Operator):
             elif (event.type == 'RIGHTMOUSE' and event.value == 'PRESS') or \
                     (event.type == 'ESC' and event.value == 'PRESS'):
 
+                # Apply the booleans waiting in the queue, forget the shapes not cut
+                self.end_cuts(context)
+                self.cutter_pool.clear()
+
                 Selection_Save_Restore(self)
                 context.view_layer.objects.active = self.CurrentActive
 
@@ -348,6 +483,10 @@ class CARVER_OT_operator(bpy.types.Operator):
             import traceback
             traceback.print_exc()
 
+            # No queued boolean, queued shape or pooled cutter is left in the scene
+            self.end_cuts(context)
+            self.cutter_pool.clear()
+
             context.window.cursor_modal_set("DEFAULT")
             context.area.header_text_set(None)
             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
@@ -359,25 +498,13 @@ class CARVER_OT_operator(bpy.types.Operator):
 
     def check_region(self, context, event):
         """Get the region area where the operator is used"""
-        if context.area is not None:
-            if context.area.type == "VIEW_3D":
-                for region in context.area.regions:
-                    if region.type == "TOOLS":
-                        t_panel = region
-                    elif region.type == "UI":
-                        ui_panel = region
-
-                view_3d_region_x = Vector((context.area.x + t_panel.width, context.area.x +
-                                           context.area.width - ui_panel.width))
-                view_3d_region_y = Vector((context.region.y, context.region.y+context.region.height))
-
-                if (event.mouse_x > view_3d_region_x[0] and event.mouse_x < view_3d_region_x[1]
-                        and event.mouse_y > view_3d_region_y[0] and event.mouse_y < view_3d_region_y[1]):
-                    self.in_view_3d = True
-                else:
-                    self.in_view_3d = False
-            else:
-                self.in_view_3d = False
+        if context.area is not None and context.area.type == "VIEW_3D":
+            view = get_view_context(self, context)
+
+            self.in_view_3d = (view.region_x[0] < event.mouse_x < view.region_x[1] and
+                               view.region_y[0] < event.mouse_y < view.region_y[1])
+        else:
+            self.in_view_3d = False
 
     def CreateGeometry(self):
         context = bpy.context
@@ -401,39 +528,24 @@ class CARVER_OT_operator(bpy.types.Operator):
                 objBBDiagonal = objDiagonal(ActiveObj) / 4
         subdivisions = 2
 
-        if len(context.selected_objects) > 0:
-            bpy.ops.object.select_all(action='TOGGLE')
-
-        context.view_layer.objects.active = self.CurrentObj
-
-        bpy.data.objects[self.CurrentObj.name].select_set(True)
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.select_mode(type="EDGE")
-        if self.snapCursor is False:
-            bpy.ops.transform.translate(value=self.ViewVector * objBBDiagonal * subdivisions)
-        bpy.ops.mesh.extrude_region_move(
-            TRANSFORM_OT_translate={"value": -self.ViewVector * objBBDiagonal * subdivisions * 2})
-
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        saved_location_0 = context.scene.cursor.location.copy()
-        bpy.ops.view3d.snap_cursor_to_active()
-        saved_location = context.scene.cursor.location.copy()
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        context.scene.cursor.location = saved_location
-        bpy.ops.object.origin_set(type='ORIGIN_CURSOR')
-        context.scene.cursor.location = saved_location_0
-
-        bpy.data.objects[self.CurrentObj.name].select_set(True)
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-
-        for o in self.all_sel_obj_list:
-            bpy.data.objects[o.name].select_set(True)
+        with profiler.phase("CreateGeometry", summary=True):
+            # Build the closed solid directly, centered on its geometry
+            depth = objBBDiagonal * subdivisions
+            back = 0.0 if self.snapCursor else depth
+            self.cutter_islands = get_array_islands(self, self.cutter_coords, self.ViewVector)
+            with profiler.phase("extrusion", islands=len(self.cutter_islands)):
+                build_cutter_islands(self.CurrentObj,
+                                     [(co, direction, back - depth * 2, back)
+                                      for co, direction in self.cutter_islands],
+                                     self.cutter_closed)
+
+            # The cutter is the created object, selected and active with the initial selection
+            self.cutter_pool.detach(self.CurrentObj)
+            self.CurrentObj.display_type = 'TEXTURED'
+
+            with profiler.phase("selection_restore"):
+                self.CurrentObj.select_set(True)
+                context.view_layer.objects.active = self.CurrentObj
 
         if in_local_view:
             bpy.ops.view3d.localview()
@@ -445,179 +557,174 @@ class CARVER_OT_operator(bpy.types.Operator):
     def Cut(self):
         context = bpy.context
 
-        # Local view ?
-        in_local_view = False
-        for area in context.screen.areas:
-            if area.type == 'VIEW_3D':
-                if area.spaces[0].local_view is not None:
-                    in_local_view = True
-
-        if in_local_view:
-            bpy.ops.view3d.localview()
-
-        # Save cursor position
-        CursorLocation = context.scene.cursor.location.copy()
-
-        # List of selected objects
-        selected_obj_list = []
-
-        # Cut Mode with line
-        # Compute the bounding Box
-        objBBDiagonal = objDiagonal(self.CurrentSelection[0])
-        if self.dont_apply_boolean:
-            subdivisions = 1
-        else:
-            subdivisions = 32
-
-        # Get selected objects
-        selected_obj_list = context.selected_objects.copy()
-
-        bpy.ops.object.select_all(action='TOGGLE')
-
-        context.view_layer.objects.active = self.CurrentObj
-
-        bpy.data.objects[self.CurrentObj.name].select_set(True)
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.select_mode(type="EDGE")
-        # Translate the created mesh away from the view
-        if (self.snapCursor is False):
-            bpy.ops.transform.translate(value=self.ViewVector * objBBDiagonal * subdivisions)
-        # Extrude the mesh region and move the result
-        bpy.ops.mesh.extrude_region_move(
-            TRANSFORM_OT_translate={"value": -self.ViewVector * objBBDiagonal * subdivisions * 2})
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        for obj in self.CurrentSelection:
-            UndoAdd(self, "MESH", obj)
-
-        # List objects create with rebool
-        lastSelected = []
-
-        for ActiveObj in selected_obj_list:
-            context.scene.cursor.location = CursorLocation
-
-            if len(context.selected_objects) > 0:
-                bpy.ops.object.select_all(action='TOGGLE')
-
-            # Select cut object
-            bpy.data.objects[self.CurrentObj.name].select_set(True)
-            context.view_layer.objects.active = self.CurrentObj
-
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
-
-            # Select object to cut
-            bpy.data.objects[ActiveObj.name].select_set(True)
-            context.view_layer.objects.active = ActiveObj
+        with profiler.phase("Cut", summary=True) as cut_args:
+            # Local view ?
+            in_local_view = False
+            # No screen in background mode
+            areas = context.screen.areas if context.screen is not None else []
+            for area in areas:
+                if area.type == 'VIEW_3D':
+                    if area.spaces[0].local_view is not None:
+                        in_local_view = True
+
+            if in_local_view:
+                bpy.ops.view3d.localview()
+
+            # Get selected objects
+            selected_obj_list = context.selected_objects.copy()
+
+            # Build the cutter solid and its copies, just deep enough to go thru all the selected objects
+            if self.shape_queue and self.CurrentObj == self.queue_cutter:
+                self.cutter_islands = [island for islands in self.shape_queue for island in islands]
+            else:
+                self.cutter_islands = get_array_islands(self, self.cutter_coords, self.ViewVector)
+            with profiler.phase("extrusion", islands=len(self.cutter_islands)):
+                build_cutter_islands(self.CurrentObj,
+                                     [(co, direction) + get_cutter_depth(self, selected_obj_list, point=co[0],
+                                                                         direction=direction)
+                                      for co, direction in self.cutter_islands],
+                                     self.cutter_closed)
+
+            # Merge the overlapping shapes, or let the booleans handle the overlaps
+            with profiler.phase("overlap", islands=len(self.cutter_islands)):
+                overlap = islands_overlap(self.cutter_islands)
+            self.cutter_self_intersect = overlap and not union_cutter(self, context, self.CurrentObj)
+
+            # Skip the objects the cutter cannot reach : no boolean, no backup, no bevel update
+            with profiler.phase("culling", objects=len(selected_obj_list)):
+                target_list = [obj for obj in selected_obj_list if cutter_hits_object(self, self.CurrentObj, obj)]
+            cut_args["targets"] = len(target_list)
+            cut_args["faces_before"] = sum(len(obj.data.polygons) for obj in target_list)
+
+            # The cutter stays as a live boolean until the end of the operator
+            deferred = self.deferred_apply and self.shift is False and self.dont_apply_boolean is False
+
+            if not deferred:
+                for obj in target_list:
+                    UndoAdd(self, "MESH", obj)
+
+            # List objects create with rebool
+            lastSelected = []
+
+            # The cutter faces are selected and the target faces are not,
+            # so the faces created by the boolean stay selected for the bevel update
+            set_mesh_selection(self.CurrentObj.data, True)
+            for ActiveObj in target_list:
+                set_mesh_selection(ActiveObj.data, False)
+
+            if self.shift is False:
+                # Boolean operation on all the targets at once
+                with profiler.phase("boolean", targets=len(target_list)):
+                    for ActiveObj in target_list:
+                        boolean_operation(ActiveObj, self.CurrentObj, bool_type="DIFFERENCE",
+                                          self_intersect=self.cutter_self_intersect)
+
+                # Apply booleans from the evaluated meshes
+                if deferred:
+                    if target_list:
+                        self.apply_queue.append((self.CurrentObj, target_list))
+                        UndoAdd(self, "DEFERRED", self.CurrentObj)
+                elif self.dont_apply_boolean is False:
+                    apply_modifiers(self, context, target_list, "CT_" + self.CurrentObj.name)
+            else:
+                for ActiveObj in target_list:
+                    with profiler.phase("rebool", target=ActiveObj.name):
+                        # Rebool, the new object has the origin of the target
+                        rebool_RT = Rebool(context, self, ActiveObj, self.CurrentObj)
 
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
+                        # Test if not empty object
+                        if len(rebool_RT.data.vertices) > 0:
+                            # Create Bevel for new objects
+                            CreateBevel(context, rebool_RT, self.beveled_meshes)
 
-            # Boolean operation
-            if (self.shift is False):
-                boolean_operation(bool_type="DIFFERENCE")
-
-                # Apply booleans
-                if self.dont_apply_boolean is False:
-                    BMname = "CT_" + self.CurrentObj.name
-                    for mb in ActiveObj.modifiers:
-                        if (mb.type == 'BOOLEAN') and (mb.name == BMname):
-                            try:
-                                bpy.ops.object.modifier_apply(apply_as='DATA', modifier=BMname)
-                            except Exception:
-                                bpy.ops.object.modifier_remove(modifier=BMname)
-                                exc_type, exc_value, exc_traceback = sys.exc_info()
-                                self.report({'ERROR'}, str(exc_value))
-
-                bpy.ops.object.select_all(action='TOGGLE')
-            else:
-                # Rebool
-                Rebool(context, self)
+                            UndoAdd(self, "REBOOL", rebool_RT)
 
-                # Test if not empty object
-                if context.selected_objects[0]:
-                    rebool_RT = context.selected_objects[0]
-                    if len(rebool_RT.data.vertices) > 0:
-                        # Create Bevel for new objects
-                        CreateBevel(context, context.selected_objects[0])
+                            # Get new objects created with rebool operations
+                            if self.dont_apply_boolean is False:
+                                lastSelected.append(rebool_RT)
+                        else:
+                            remove_object(rebool_RT)
 
-                        UndoAdd(self, "REBOOL", context.selected_objects[0])
+            # Only keep the backups of the objects changed by the cut
+            UndoDiscardUnchanged(self)
 
-                        context.scene.cursor.location = ActiveObj.location
-                        bpy.ops.object.origin_set(type='ORIGIN_CURSOR')
-                    else:
-                        bpy.ops.object.delete(use_global=False)
-
-                context.scene.cursor.location = CursorLocation
-
-            if self.dont_apply_boolean is False:
-                # Apply booleans
-                BMname = "CT_" + self.CurrentObj.name
-                for mb in ActiveObj.modifiers:
-                    if (mb.type == 'BOOLEAN') and (mb.name == BMname):
-                        try:
-                            bpy.ops.object.modifier_apply(apply_as='DATA', modifier=BMname)
-                        except Exception:
-                            bpy.ops.object.modifier_remove(modifier=BMname)
-                            exc_type, exc_value, exc_traceback = sys.exc_info()
-                            self.report({'ERROR'}, str(exc_value))
-                # Get new objects created with rebool operations
-                if len(context.selected_objects) > 0:
-                    if self.shift is True:
-                        # Get the last object selected
-                        lastSelected.append(context.selected_objects[0])
-
-        context.scene.cursor.location = CursorLocation
-
-        if self.dont_apply_boolean is False:
-            # Remove cut object
-            if len(context.selected_objects) > 0:
-                bpy.ops.object.select_all(action='TOGGLE')
-            bpy.data.objects[self.CurrentObj.name].select_set(True)
-            bpy.ops.object.delete(use_global=False)
+            if self.dont_apply_boolean:
+                # The cutter of the live booleans stays in the scene, undo removes it with its booleans
+                self.cutter_pool.detach(self.CurrentObj)
+                UndoAdd(self, "LIVE", self.CurrentObj, target_list)
+            elif not (deferred and target_list):
+                # Give back the cut object, reused by the next cut
+                with profiler.phase("cleanup"):
+                    self.cutter_pool.release(self.CurrentObj)
 
-        if len(context.selected_objects) > 0:
-            bpy.ops.object.select_all(action='TOGGLE')
+            # Update bevel, the queued booleans are updated when applied
+            if self.Auto_BevelUpdate and not deferred:
+                update_bevel(context, target_list + lastSelected, self.beveled_meshes)
 
-        # Select cut objects
-        for obj in lastSelected:
-            bpy.data.objects[obj.name].select_set(True)
+            if in_local_view:
+                bpy.ops.view3d.localview()
 
-        for ActiveObj in selected_obj_list:
-            bpy.data.objects[ActiveObj.name].select_set(True)
-            context.view_layer.objects.active = ActiveObj
+            cut_args["faces_after"] = sum(len(obj.data.polygons) for obj in target_list + lastSelected)
 
-        # Update bevel
-        list_act_obj = context.selected_objects.copy()
-        if self.Auto_BevelUpdate:
-            update_bevel(context)
+        # Reset variables
+        self.CutMode = False
+        self.mouse_path.clear()
+        self.mouse_path = [(0, 0), (0, 0)]
 
-        # Re-select initial objects
-        bpy.ops.object.select_all(action='TOGGLE')
+    def queue_or_cut(self, context):
+        """Cut with the new cutter, or add its shape to the queue in multi shape mode"""
+        if not self.multi_shape:
+            self.Cut()
+            UndoListUpdate(self)
+            return
 
-        for ActiveObj in selected_obj_list:
-            bpy.data.objects[ActiveObj.name].select_set(True)
-            context.view_layer.objects.active = ActiveObj
+        self.shape_queue.append(get_array_islands(self, self.cutter_coords, self.ViewVector))
 
-        if in_local_view:
-            bpy.ops.view3d.localview()
+        # The object of the first shape is the cutter of all the queued shapes
+        if self.queue_cutter is None:
+            self.queue_cutter = self.CurrentObj
+        else:
+            self.cutter_pool.release(self.CurrentObj)
+        self.CurrentObj = self.queue_cutter
 
-        # Reset variables
         self.CutMode = False
         self.mouse_path.clear()
         self.mouse_path = [(0, 0), (0, 0)]
 
+    def commit_shape_queue(self, context):
+        """Cut with all the queued shapes merged in one cutter : one boolean, undo step and bevel update"""
+        if not self.shape_queue:
+            return
+        self.CurrentObj = self.queue_cutter
+        self.Cut()
+        UndoListUpdate(self)
+        self.shape_queue.clear()
+        self.queue_cutter = None
+
+    def clear_shape_queue(self):
+        """Forget the queued shapes and remove their cutter"""
+        self.shape_queue.clear()
+        if self.queue_cutter is not None:
+            self.cutter_pool.release(self.queue_cutter)
+            self.queue_cutter = None
+
+    def end_cuts(self, context):
+        """Apply the queued booleans (removed if the apply fails) and forget the queued shapes"""
+        try:
+            flush_apply_queue(self, context)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            drop_apply_queue(self)
+        self.clear_shape_queue()
+
     def cancel(self, context):
         # Note: used to prevent memory leaks on quitting Blender while the modal operator
         # is still running, gets called on return {"CANCELLED"}
         bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
+        self.remove_redraw_timer(context)
+        self.end_cuts(context)
+        self.cutter_pool.clear()
 
 
 def register():
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """ Timings of the phases of the cut pipeline, exported as Chrome trace events """
+
+    # Oldest events are dropped above this count
+    max_events = 100000
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.depth = 0
+        # Top level phases since the last summary, children of the running phases
+        self.pending = []
+        self.children = []
+        # Breakdown of the last cut : (name, duration, [(phase, duration)], args)
+        self.last = None
+        self.serial = 0
+
+    @contextmanager
+    def phase(self, name, summary=False, **args):
+        """ Time a phase, the yielded dict can receive more args (face counts) """
+        start = time.perf_counter()
+        parent_children = self.children
+        self.children = []
+        self.depth += 1
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter() - start
+            self.depth -= 1
+            children = self.children
+            self.children = parent_children
+
+            self.events.append({
+                "name": name,
+                "cat": "carver",
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": args,
+            })
+            if len(self.events) > self.max_events:
+                del self.events[:len(self.events) - self.max_events]
+
+            if self.depth > 0:
+                self.children.append((name, duration))
+            elif summary:
+                self.last = (name, duration, self.pending + children, args)
+                self.pending = []
+                self.serial += 1
+            else:
+                self.pending.append((name, duration))
+
+    def breakdown(self):
+        """ Duration of each phase of the last cut, the phases used several times are added """
+        if self.last is None:
+            return None
+        name, duration, children, args = self.last
+        totals = {}
+        for child, child_duration in children:
+            totals[child] = totals.get(child, 0.0) + child_duration
+        return name, duration, totals, args
+
+    def summary_text(self):
+        """ One line summary of the last cut, in milliseconds """
+        breakdown = self.breakdown()
+        if breakdown is None:
+            return "No cut"
+        name, duration, totals, args = breakdown
+        text = name + " " + str(int(duration * 1000)) + " ms : "
+        text += ", ".join(child + " " + str(int(d * 1000)) for child, d in totals.items())
+        if "faces_before" in args and "faces_after" in args:
+            text += " | faces " + str(args["faces_before"]) + " > " + str(args["faces_after"])
+        return text
+
+    def export(self, path):
+        """ Write the events in the Chrome trace event format (chrome://tracing, Perfetto) """
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def clear(self):
+        self.__init__()
+
+
+profiler = Profiler()
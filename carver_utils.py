@@ -5,8 +5,14 @@ import gpu
 from gpu_extras.batch import batch_for_shader
 import math
 import sys
+import time
 import random
+import zlib
+import hashlib
+import logging
 import bmesh
+import numpy as np
+from types import SimpleNamespace
 from mathutils import (
     Euler,
     Matrix,
@@ -16,6 +22,9 @@ from mathutils import (
 from mathutils.geometry import (
     intersect_line_plane,
 )
+from mathutils.bvhtree import BVHTree
+
+from .carver_profiler import profiler
 
 from math import (
     sin,
@@ -32,206 +41,720 @@ from bpy_extras.view3d_utils import (
     location_3d_to_region_2d,
 )
 
+# Chosen boolean strategies and their durations
+logger = logging.getLogger(__name__)
 
-def CreateRectangleCutterMesh(self, context):
-    """ Create a rectangle mesh """
-    far_limit = 10000.0
-    faces = []
-
-    # Get the mouse coordinates
-    coord = self.mouse_path[0][0], self.mouse_path[0][1]
-
-    # New mesh
-    me = bpy.data.meshes.new('CMT_Square')
-    bm = bmesh.new()
-    bm.from_mesh(me)
 
-    # New object and link it to the scene
-    ob = bpy.data.objects.new('CMT_Square', me)
-    self.CurrentObj = ob
-    context.collection.objects.link(ob)
+def get_view_context(self, context):
+    """ Return the cached bounds, space, grid settings and matrices of the working 3D view
 
-    # Scene information
+    The cache is rebuilt only when the size of the area / region or the view matrices change.
+    """
+    area = context.area
     region = context.region
     rv3d = context.region_data
-    depth_location = region_2d_to_vector_3d(region, rv3d, coord)
-    self.ViewVector = depth_location
 
-    # Get a point on a infinite plane and its direction
-    plane_normal = depth_location
-    plane_direction = plane_normal.normalized()
+    key = (area.x, area.y, area.width, area.height, region.x, region.y, region.width, region.height)
+    view = self.view_context
+    if view is not None and view.key == key and view.perspective_matrix == rv3d.perspective_matrix:
+        return view
+
+    # Width of the tool and side panels
+    t_panel_width = ui_panel_width = 0
+    for r in area.regions:
+        if r.type == "TOOLS":
+            t_panel_width = r.width
+        elif r.type == "UI":
+            ui_panel_width = r.width
+
+    space = area.spaces.active
+    view_matrix = rv3d.view_matrix.copy()
+    perspective_matrix = rv3d.perspective_matrix.copy()
+
+    view = SimpleNamespace(
+        key=key,
+        space=space,
+        width=region.width,
+        height=region.height,
+        region_x=(area.x + t_panel_width, area.x + area.width - ui_panel_width),
+        region_y=(region.y, region.y + region.height),
+        area_width=area.width,
+        area_height=area.height,
+        grid_scale=space.overlay.grid_scale,
+        grid_subdivisions=space.overlay.grid_subdivisions,
+        is_perspective=rv3d.is_perspective,
+        perspective_matrix=perspective_matrix,
+        view_matrix=view_matrix,
+        pers=np.array(perspective_matrix),
+        pers_inv=np.array(perspective_matrix.inverted()),
+        view_inv=np.array(view_matrix.inverted()),
+    )
+    self.view_context = view
+    return view
+
+
+def update_view_grid(self):
+    """ Read again the grid settings of the cached view """
+    view = self.view_context
+    if view is not None:
+        view.grid_scale = view.space.overlay.grid_scale
+        view.grid_subdivisions = view.space.overlay.grid_subdivisions
+
+
+def get_view_rays(view, coords):
+    """ Return the origins and directions of the view rays going thru an array of 2d coordinates """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    count = len(coords)
+
+    # Normalized device coordinates of the region
+    ndc = np.empty((count, 2))
+    ndc[:, 0] = (2.0 * coords[:, 0] / view.width) - 1.0
+    ndc[:, 1] = (2.0 * coords[:, 1] / view.height) - 1.0
+
+    view_inv = view.view_inv
+    pers_inv = view.pers_inv
+
+    if view.is_perspective:
+        # All the rays start at the view location and go thru the unprojected points
+        points = np.empty((count, 4))
+        points[:, :2] = ndc
+        points[:, 2] = -0.5
+        points[:, 3] = 1.0
+        points = points @ pers_inv.T
+        origins = np.broadcast_to(view_inv[:3, 3], (count, 3))
+        directions = points[:, :3] / points[:, 3:] - origins
+    else:
+        # All the rays are parallel and start on the view plane
+        origins = ndc[:, :1] * pers_inv[:3, 0] + ndc[:, 1:] * pers_inv[:3, 1] + pers_inv[:3, 3]
+        directions = np.broadcast_to(-view_inv[:3, 2], (count, 3))
+
+    directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+    return origins, directions
+
+
+def region_2d_to_plane_3d(view, coords, plane_point, plane_normal):
+    """ Project an array of 2d coordinates on an infinite plane, return a (n, 3) array
+
+    Same projection as the former per point code : the point on each view ray
+    (region_2d_to_location_3d at the depth of the ray direction) is moved along
+    the plane normal, the view vector under the first point, onto the plane.
+    In orthographic views this is the intersection of the view rays with the plane.
+    """
+    origins, directions = get_view_rays(view, coords)
+    plane_point = np.asarray(plane_point, dtype=np.float64)
+    plane_normal = np.asarray(plane_normal, dtype=np.float64)
+    plane_normal = plane_normal / np.linalg.norm(plane_normal)
+
+    points = origins
+    if view.is_perspective:
+        # Point of each ray on the view aligned plane going thru the ray direction
+        view_z = view.view_inv[:3, 2]
+        denom = directions @ view_z
+        parallel = np.abs(denom) < 1e-12
+        depth = ((directions - origins) @ view_z) / np.where(parallel, 1.0, denom)
+        depth[parallel] = 0.0
+        points = origins + directions * depth[:, None]
+
+    return points + plane_normal * ((plane_point - points) @ plane_normal)[:, None]
+
+
+def cutter_plane(self, context, coord, plane_point=None):
+    """ Return the point of the plane used to build the cutter and the view vector under coord """
+    # The view direction under the first point gives the depth of the cutter
+    view_vector = region_2d_to_vector_3d(context.region, context.region_data, coord)
+
+    if plane_point is None:
+        if self.snapCursor:
+            plane_point = context.scene.cursor.location
+        else:
+            plane_point = self.OpsObj.location if self.OpsObj is not None else Vector((0.0, 0.0, 0.0))
 
-    if self.snapCursor:
-        plane_point = context.scene.cursor.location
+    return plane_point, view_vector
+
+
+def get_cutter_plane(self, context, coord, plane_point=None):
+    """ Return the point and the normal of the plane used to build the cutter, keep the view vector """
+    plane_point, self.ViewVector = cutter_plane(self, context, coord, plane_point)
+    return plane_point, self.ViewVector.normalized()
+
+
+def clear_mesh(me):
+    """ Remove all the geometry of a mesh """
+    if hasattr(me, "clear_geometry"):
+        me.clear_geometry()
     else:
-        plane_point = self.OpsObj.location if self.OpsObj is not None else Vector((0.0, 0.0, 0.0))
+        bm = bmesh.new()
+        bm.to_mesh(me)
+        bm.free()
+
+
+def prism_arrays(verts, direction, front, back, closed=True):
+    """ Return the coordinates, loops and face sizes of the shape extruded along the direction
+
+    The cap is moved by back (far cap) and by front (near cap) along the direction,
+    the side quads and the caps have outward normals.
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    count = len(verts)
+    direction = np.asarray(direction, dtype=np.float64)
+    direction = direction / np.linalg.norm(direction)
+
+    # Caps need at least 3 vertices
+    closed = closed and count > 2
+
+    # Orient the shape so the normal of the far cap points away from the view (Newell normal)
+    if closed:
+        nxt = np.roll(verts, -1, axis=0)
+        normal = np.cross(verts, nxt).sum(axis=0)
+        if normal @ direction < 0.0:
+            verts = verts[::-1]
+
+    co = np.concatenate((verts + direction * back, verts + direction * front))
+
+    # Side quads between the far cap (0..n-1) and the near cap (n..2n-1)
+    idx = np.arange(count)
+    nxt = np.roll(idx, -1)
+    if not closed:
+        idx, nxt = idx[:-1], nxt[:-1]
+    loops = [np.column_stack((idx, idx + count, nxt + count, nxt)).ravel()]
+    totals = [np.full(len(idx), 4)]
+
+    if closed:
+        # Far cap keeps the winding, near cap is reversed
+        loops += [np.arange(count), np.arange(2 * count - 1, count - 1, -1)]
+        totals += [(count, count)]
+
+    return co, np.concatenate(loops), np.concatenate(totals)
+
+
+def build_cutter_islands(ob, islands, closed=True):
+    """ Fill the cutter mesh with several extruded shapes (verts, direction, front, back)
+
+    The mesh is written in one pass, the object origin is placed at the median of the vertices.
+    """
+    co, loops, totals = [], [], []
+    offset = 0
+    for verts, direction, front, back in islands:
+        island_co, island_loops, island_totals = prism_arrays(verts, direction, front, back, closed)
+        co.append(island_co)
+        loops.append(island_loops + offset)
+        totals.append(island_totals)
+        offset += len(island_co)
+
+    co = np.concatenate(co) if co else np.zeros((0, 3))
+    loops = np.concatenate(loops).astype(np.int32) if loops else np.zeros(0, dtype=np.int32)
+    totals = np.concatenate(totals).astype(np.int32) if totals else np.zeros(0, dtype=np.int32)
+    starts = np.zeros(len(totals), dtype=np.int32)
+    starts[1:] = np.cumsum(totals)[:-1]
+
+    center = co.mean(axis=0) if len(co) else np.zeros(3)
+    co = co - center
+
+    me = ob.data
+    clear_mesh(me)
+    me.vertices.add(len(co))
+    me.vertices.foreach_set("co", co.astype(np.float32).ravel())
+    me.loops.add(len(loops))
+    me.loops.foreach_set("vertex_index", loops)
+    me.polygons.add(len(totals))
+    me.polygons.foreach_set("loop_start", starts)
+    me.polygons.foreach_set("loop_total", totals)
+    me.update(calc_edges=True)
+
+    ob.location = center
+
+
+def rotation_arrays(axis, angles):
+    """ Rotation matrices (n, 3, 3) around a unit axis (Rodrigues formula) """
+    x, y, z = axis
+    cross = np.array(((0.0, -z, y), (z, 0.0, -x), (-y, x, 0.0)))
+    cos = np.cos(angles)[:, None, None]
+    sin = np.sin(angles)[:, None, None]
+    return cos * np.eye(3) + sin * cross + (1.0 - cos) * np.outer(axis, axis)
+
+
+def get_array_islands(self, coords, direction):
+    """ Return the copies (coords, direction) of the cutter shape for the array and mirror options
+
+    Linear copies are placed along the horizontal of the view, radial copies around the working
+    object, and all the copies are mirrored across the local axes of the working object.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    normal = np.array(direction, dtype=np.float64)
+    normal /= np.linalg.norm(normal)
+    islands = [(coords, normal)]
+    if len(coords) == 0:
+        return islands
+
+    origin = np.array(self.OpsObj.matrix_world.translation) if self.OpsObj is not None else np.zeros(3)
+
+    if self.array_mode == 1 and self.view_context is not None:
+        # Horizontal of the view in the cut plane, copies spaced by half the shape width
+        axis = self.view_context.view_inv[:3, 0]
+        axis = axis - (axis @ normal) * normal
+        axis /= np.linalg.norm(axis)
+        dist = coords @ axis
+        spacing = (dist.max() - dist.min()) * 1.5
+        if spacing > 0.0:
+            islands += [(coords + axis * spacing * i, normal) for i in range(1, self.array_count)]
+
+    elif self.array_mode == 2:
+        # Around the working object origin, projected on the cut plane
+        center = origin - ((origin - coords[0]) @ normal) * normal
+        angles = np.arange(1, self.array_count) * (2.0 * math.pi / self.array_count)
+        for rot in rotation_arrays(normal, angles):
+            islands.append(((coords - center) @ rot.T + center, normal))
+
+    # Mirror all the copies across the planes of the working object axes
+    axes = self.mirror_modes[self.mirror_mode][1]
+    if axes:
+        matrix = np.array(self.OpsObj.matrix_world) if self.OpsObj is not None else np.eye(4)
+        for i in axes:
+            axis = matrix[:3, i] / np.linalg.norm(matrix[:3, i])
+            islands += [(co - 2.0 * ((co - origin) @ axis)[:, None] * axis,
+                         d - 2.0 * (d @ axis) * axis) for co, d in islands]
+
+    return islands
+
+
+def point_in_polygon(point, poly):
+    """ Test if a 2d point is inside a 2d polygon (n, 2), crossing number """
+    x, y = point
+    x0, y0 = poly[:, 0], poly[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    spans = (y0 > y) != (y1 > y)
+    dy = np.where(spans, y1 - y0, 1.0)
+    crossings = spans & (x < x0 + (x1 - x0) * (y - y0) / dy)
+    return np.count_nonzero(crossings) % 2 == 1
+
+
+def polygons_overlap(a, b):
+    """ Test if two 2d polygons (n, 2) overlap : some edges cross or one is inside the other """
+    a1, b1 = np.roll(a, -1, axis=0), np.roll(b, -1, axis=0)
+
+    def side(start, end, p):
+        return (end[..., 0] - start[..., 0]) * (p[..., 1] - start[..., 1]) - \
+               (end[..., 1] - start[..., 1]) * (p[..., 0] - start[..., 0])
+
+    # Edges of a (rows) against edges of b (columns), touching edges count as crossing
+    sa, ea, sb, eb = a[:, None], a1[:, None], b[None], b1[None]
+    cross = (side(sa, ea, sb) * side(sa, ea, eb) <= 0.0) & (side(sb, eb, sa) * side(sb, eb, ea) <= 0.0)
+    if cross.any():
+        return True
+
+    return point_in_polygon(a[0], b) or point_in_polygon(b[0], a)
+
+
+def islands_overlap(islands):
+    """ Test if some of the cutter shapes (coords, direction) overlap
+
+    The shapes are compared in the plane of the first one : bounds, then edges and inside tests.
+    Shapes extruded along another direction are counted as overlapping.
+    """
+    if len(islands) < 2:
+        return False
+
+    normal = np.asarray(islands[0][1], dtype=np.float64)
+    normal = normal / np.linalg.norm(normal)
+    u = np.cross(normal, (1.0, 0.0, 0.0) if abs(normal[0]) < 0.9 else (0.0, 1.0, 0.0))
+    u /= np.linalg.norm(u)
+    v = np.cross(normal, u)
+
+    shapes = []
+    for co, direction in islands:
+        direction = np.asarray(direction, dtype=np.float64)
+        if abs(direction @ normal) < 0.9999 * np.linalg.norm(direction):
+            return True
+        co = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+        shapes.append(np.column_stack((co @ u, co @ v)))
+
+    # Pairs of shapes with overlapping bounds
+    mins = np.array([shape.min(axis=0) for shape in shapes])
+    maxs = np.array([shape.max(axis=0) for shape in shapes])
+    pairs = np.all((mins[:, None] <= maxs[None]) & (mins[None] <= maxs[:, None]), axis=2)
+    for i, j in np.argwhere(np.triu(pairs, 1)):
+        if polygons_overlap(shapes[i], shapes[j]):
+            return True
+    return False
+
+
+def get_array_preview(self, context, coords):
+    """ Return the 2d coordinates of the copies of a 2d shape, as drawn in the region """
+    if self.array_mode == 0 and not self.mirror_modes[self.mirror_mode][1]:
+        return []
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) < 2:
+        return []
+
+    # Same plane as the cutter, the state of the operator is not changed by the drawing
+    view = get_view_context(self, context)
+    plane_point, plane_direction = cutter_plane(self, context, coords[0])
+    plane_direction = plane_direction.normalized()
+    co = region_2d_to_plane_3d(view, coords, plane_point, plane_direction)
+
+    previews = []
+    for island, direction in get_array_islands(self, co, plane_direction)[1:]:
+        region_co = region_coords(view, island)
+        if region_co is not None:
+            previews.append(region_co)
+    return previews
+
+
+def region_coords(view, co):
+    """ Project an array of 3d coordinates on the region, None if a point is behind the view """
+    h = np.column_stack((co, np.ones(len(co)))) @ view.pers.T
+    if np.any(h[:, 3] <= 1e-6):
+        return None
+    ndc = h[:, :2] / h[:, 3:]
+    return np.column_stack(((ndc[:, 0] + 1.0) * view.width / 2.0,
+                            (ndc[:, 1] + 1.0) * view.height / 2.0)).astype(np.float32)
+
+
+def simplify_path(coords, tolerance, closed=True):
+    """ Remove the points of a 2d path closer than tolerance to the simplified path (Ramer-Douglas-Peucker) """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if tolerance <= 0.0 or len(coords) < 3:
+        return coords
+
+    if closed:
+        # Split the loop at the point farthest from the first one
+        points = np.concatenate((coords, coords[:1]))
+        far = int(np.argmax(np.linalg.norm(coords - coords[0], axis=1)))
+        stack = [(0, far), (far, len(points) - 1)]
+    else:
+        points = coords
+        stack = [(0, len(points) - 1)]
+
+    keep = np.zeros(len(points), dtype=bool)
+    for first, last in stack:
+        keep[first] = keep[last] = True
+
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        # Distance of the inner points to the segment (first, last)
+        start = points[first]
+        seg = points[last] - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(seg[0], seg[1])
+        if length < 1e-9:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(seg[0] * inner[:, 1] - seg[1] * inner[:, 0]) / length
 
-    # Find the intersection of a line going thru each vertex and the infinite plane
-    for v_co in self.rectangle_coord:
-        vec = region_2d_to_vector_3d(region, rv3d, v_co)
-        p0 = region_2d_to_location_3d(region, rv3d, v_co, vec)
-        p1 = region_2d_to_location_3d(region, rv3d, v_co, vec) + plane_direction * far_limit
-        faces.append(bm.verts.new(intersect_line_plane(p0, p1, plane_point, plane_direction)))
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            keep[first + 1 + i] = True
+            stack.append((first, first + 1 + i))
+            stack.append((first + 1 + i, last))
 
-    # Update vertices index
-    bm.verts.index_update()
-    # New faces
-    t_face = bm.faces.new(faces)
-    # Set mesh
-    bm.to_mesh(me)
+    simplified = points[keep]
+    if closed:
+        simplified = simplified[:-1]
+        # Keep the original shape if nothing closed is left
+        if len(simplified) < 3:
+            return coords
 
+    return simplified
 
-def CreateCutLine(self, context):
-    """ Create a polygon mesh """
-    far_limit = 10000.0
-    vertices = []
-    faces = []
-    loc = []
 
-    # Get the mouse coordinates
-    coord = self.mouse_path[0][0], self.mouse_path[0][1]
+def add_lasso_point(self, coord):
+    """ Add a point to the lasso path, simplified while the points stream in
+
+    The last point of the path is replaced by the new one while all the points skipped since
+    the previous kept point stay within the tolerance of the new segment.
+    """
+    path = self.mouse_path
+    tolerance = self.lasso_tolerance
+    coord = (float(coord[0]), float(coord[1]))
+
+    if len(path) == 0:
+        path.append(coord)
+        return
+
+    # Too close to the last point
+    if math.hypot(coord[0] - path[-1][0], coord[1] - path[-1][1]) <= tolerance:
+        return
+
+    if len(path) >= 2 and len(self.lasso_skipped) < 256:
+        # Distance of the skipped points and the last point to the segment (previous kept point, new point)
+        start = np.array(path[-2])
+        seg = np.array(coord) - start
+        inner = np.array(self.lasso_skipped + [path[-1]]) - start
+        length = math.hypot(seg[0], seg[1])
+        dist = np.abs(seg[0] * inner[:, 1] - seg[1] * inner[:, 0]) / length
+
+        if dist.max() <= tolerance:
+            self.lasso_skipped.append(path[-1])
+            path[-1] = coord
+            return
+
+    self.lasso_skipped.clear()
+    path.append(coord)
+
 
-    # New mesh
-    me = bpy.data.meshes.new('CMT_Line')
-    bm = bmesh.new()
-    bm.from_mesh(me)
+class CutterPool:
+    """ One cutter object and mesh by shape, reused by all the cuts of the operator
 
-    # New object and link it to the scene
-    ob = bpy.data.objects.new('CMT_Line', me)
+    A cutter kept in the scene (live boolean, created geometry) is detached from the pool,
+    everything else the pool created is removed with clear().
+    """
+
+    def __init__(self):
+        # (object, shape name) created by the pool, free objects by shape name
+        self.owned = []
+        self.free = {}
+
+    def acquire(self, context, name):
+        """ Return an unused cutter object for the shape, linked to the collection """
+        free = self.free.get(name)
+        if free:
+            ob = free.pop()
+        else:
+            ob = bpy.data.objects.new(name, bpy.data.meshes.new(name))
+            self.owned.append((ob, name))
+        context.collection.objects.link(ob)
+        return ob
+
+    def release(self, ob):
+        """ Unlink a cutter no longer used, the next cut with the same shape reuses it
+
+        Its geometry is cleared and it is displayed as wire, a reused cutter never shows an old cut.
+        """
+        for owned, name in self.owned:
+            if owned == ob:
+                for coll in ob.users_collection:
+                    coll.objects.unlink(ob)
+                clear_mesh(ob.data)
+                ob.display_type = 'WIRE'
+                if ob not in self.free.setdefault(name, []):
+                    self.free[name].append(ob)
+                return
+        remove_object(ob)
+
+    def detach(self, ob):
+        """ The cutter stays in the scene, it is no longer reused or removed by the pool """
+        self.owned = [(owned, name) for owned, name in self.owned if owned != ob]
+        for free in self.free.values():
+            if ob in free:
+                free.remove(ob)
+
+    def clear(self):
+        """ Remove all the objects and meshes created by the pool """
+        for ob, name in self.owned:
+            remove_object(ob)
+        self.owned.clear()
+        self.free.clear()
+
+
+def remove_object(ob):
+    """ Remove an object from the file, and its mesh if no longer used """
+    me = ob.data
+    bpy.data.objects.remove(ob, do_unlink=True)
+    if me is not None and me.users == 0:
+        bpy.data.meshes.remove(me)
+
+
+def init_cut_state(self):
+    """ Runtime state of the cuts, shared by the modal operator and the benchmark """
+    # Cut type (Rectangle, Circle, Line, Lasso)
+    self.rectangle = 0
+    self.polygon = 1
+    self.circle = 2
+    self.lasso = 3
+
+    # Selected type of cut
+    self.CutterShape = 0
+
+    # Cut Rectangle coordinates, mouse path and lasso points removed since the last kept point
+    self.rectangle_coord = []
+    self.mouse_path = [(0, 0), (0, 0)]
+    self.lasso_skipped = []
+
+    self.all_sel_obj_list = []
+    self.save_active_obj = None
+
+    # Bounds, space and matrices of the working view
+    self.view_context = None
+
+    self.dont_apply_boolean = False
+    self.Auto_BevelUpdate = True
+
+    # Booleans applied all at once when leaving the operator
+    self.deferred_apply = False
+    self.apply_queue = []
+
+    # Circle variables
+    self.stepAngle = [2, 4, 5, 6, 9, 10, 15, 20, 30, 40, 45, 60, 72, 90]
+    self.step = 4
+
+    # Primitives Position
+    self.xpos = 0
+    self.ypos = 0
+    self.InitPosition = False
+
+    # Close polygonal shape
+    self.Closed = True
+
+    # Depth Cursor
+    self.snapCursor = False
+
+    # Working object
+    self.OpsObj = None
+
+    self.ViewVector = Vector()
+    self.CurrentObj = None
+
+    # Cutter objects and meshes reused by the cuts, removed at the end
+    self.cutter_pool = CutterPool()
+
+    # BVH trees of the targets and count of the geometry changes, by mesh
+    self.bvh_cache = {}
+    self.mesh_generation = {}
+
+    # Meshes whose whole bevel was updated once in the session, the next updates only change the cut region
+    self.beveled_meshes = set()
+
+    # Timings of the last cut in the HUD
+    self.show_profile = False
+
+    # Array of the cutter : 0 Off, 1 Linear, 2 Radial, and mirror across the working object axes
+    self.array_modes = ("Off", "Linear", "Radial")
+    self.array_mode = 0
+    self.array_count = 4
+    self.mirror_modes = (("Off", ()), ("X", (0,)), ("Y", (1,)), ("Z", (2,)),
+                         ("XY", (0, 1)), ("XYZ", (0, 1, 2)))
+    self.mirror_mode = 0
+    self.cutter_islands = []
+    self.cutter_self_intersect = False
+
+    # Multi shape : the shapes are queued and cut at once with a single cutter
+    self.multi_shape = False
+    self.shape_queue = []
+    self.queue_cutter = None
+
+    # Undo Variables
+    self.UList = []
+    self.UList_Index = -1
+    self.UndoOps = []
+    self.UndoPool = {}
+
+
+def CreateRectangleCutterMesh(self, context):
+    """ Create a rectangle mesh """
+    # Mesh and object from the pool, linked to the scene
+    ob = self.cutter_pool.acquire(context, 'CMT_Square')
     self.CurrentObj = ob
-    context.collection.objects.link(ob)
 
-    # Scene information
-    region = context.region
-    rv3d = context.region_data
-    depth_location = region_2d_to_vector_3d(region, rv3d, coord)
-    self.ViewVector = depth_location
+    # Get a point on a infinite plane and its direction
+    plane_point, plane_direction = get_cutter_plane(self, context, self.mouse_path[0])
+
+    # Find the intersection of the view rays going thru the vertices and the infinite plane
+    with profiler.phase("cutter_build", points=len(self.rectangle_coord)):
+        self.cutter_coords = region_2d_to_plane_3d(get_view_context(self, context),
+                                                   self.rectangle_coord, plane_point, plane_direction)
+    self.cutter_closed = True
+
+
+def CreateCutLine(self, context):
+    """ Create a polygon mesh """
+    # Mesh and object from the pool, linked to the scene
+    ob = self.cutter_pool.acquire(context, 'CMT_Line')
+    self.CurrentObj = ob
 
     # Get a point on a infinite plane and its direction
-    plane_normal = depth_location
-    plane_direction = plane_normal.normalized()
+    plane_point, plane_direction = get_cutter_plane(self, context, self.mouse_path[0])
 
-    if self.snapCursor:
-        plane_point = context.scene.cursor.location
-    else:
-        plane_point = self.OpsObj.location if self.OpsObj is not None else Vector((0.0, 0.0, 0.0))
-
-    # Use dict to remove doubles
-    # Find the intersection of a line going thru each vertex and the infinite plane
-    for idx, v_co in enumerate(list(dict.fromkeys(self.mouse_path))):
-        vec = region_2d_to_vector_3d(region, rv3d, v_co)
-        p0 = region_2d_to_location_3d(region, rv3d, v_co, vec)
-        p1 = region_2d_to_location_3d(region, rv3d, v_co, vec) + plane_direction * far_limit
-        loc.append(intersect_line_plane(p0, p1, plane_point, plane_direction))
-        vertices.append(bm.verts.new(loc[idx]))
-
-        if idx > 0:
-            bm.edges.new([vertices[idx-1], vertices[idx]])
-
-        faces.append(vertices[idx])
-
-    # Update vertices index
-    bm.verts.index_update()
-
-    # Nothing is selected, create close geometry
-    if self.CreateMode:
-        if self.Closed and len(vertices) > 1:
-            bm.edges.new([vertices[-1], vertices[0]])
-            bm.faces.new(faces)
-    else:
-        # Create faces if more than 2 vertices
-        if len(vertices) > 1:
-            bm.edges.new([vertices[-1], vertices[0]])
-            bm.faces.new(faces)
+    # Nothing is selected, create close geometry only if asked, a lasso is always closed
+    lasso = self.CutterShape == self.lasso
+    self.cutter_closed = self.Closed if self.CreateMode and not lasso else True
+
+    # Use dict to remove doubles, then remove the points that do not change the shape
+    coords = list(dict.fromkeys(self.mouse_path))
+    tolerance = self.lasso_tolerance if lasso else self.simplify_tolerance
+    coords = simplify_path(coords, tolerance, self.cutter_closed)
 
-    bm.to_mesh(me)
+    # Two points are a single segment, closing them would give the same edge twice
+    if len(coords) < 3:
+        self.cutter_closed = False
+
+    # Find the intersection of the view rays going thru the vertices and the infinite plane
+    with profiler.phase("cutter_build", points=len(coords)):
+        self.cutter_coords = region_2d_to_plane_3d(get_view_context(self, context),
+                                                   coords, plane_point, plane_direction)
 
 
 def CreateCircleCutterMesh(self, context):
     """ Create a circle mesh """
-    far_limit = 10000.0
-    FacesList = []
-
     # Get the mouse coordinates
     mouse_pos_x = self.mouse_path[0][0]
     mouse_pos_y = self.mouse_path[0][1]
-    coord = self.mouse_path[0][0], self.mouse_path[0][1]
-
-    # Scene information
-    region = context.region
-    rv3d = context.region_data
-    depth_location = region_2d_to_vector_3d(region, rv3d, coord)
-    self.ViewVector = depth_location
 
     # Get a point on a infinite plane and its direction
-    plane_point = context.scene.cursor.location if self.snapCursor else Vector((0.0, 0.0, 0.0))
-    plane_normal = depth_location
-    plane_direction = plane_normal.normalized()
+    cursor_point = context.scene.cursor.location if self.snapCursor else Vector((0.0, 0.0, 0.0))
+    plane_point, plane_direction = get_cutter_plane(self, context, self.mouse_path[0], cursor_point)
 
-    # New mesh
-    me = bpy.data.meshes.new('CMT_Circle')
-    bm = bmesh.new()
-    bm.from_mesh(me)
-
-    # New object and link it to the scene
-    ob = bpy.data.objects.new('CMT_Circle', me)
+    # Mesh and object from the pool, linked to the scene
+    ob = self.cutter_pool.acquire(context, 'CMT_Circle')
     self.CurrentObj = ob
-    context.collection.objects.link(ob)
 
     # Create a circle using a tri fan
     tris_fan, indices = draw_circle(self, mouse_pos_x, mouse_pos_y)
 
     # Remove the vertex in the center to get the outer line of the circle
-    verts = tris_fan[1:]
+    # Find the intersection of the view rays going thru the vertices and the infinite plane
+    with profiler.phase("cutter_build", points=len(tris_fan[1:])):
+        self.cutter_coords = region_2d_to_plane_3d(get_view_context(self, context),
+                                                   tris_fan[1:], plane_point, plane_direction)
+    self.cutter_closed = True
+
+
+# Unit circle coordinates and triangle fan indices, by angle step
+circle_tables = {}
+
+
+def get_circle_table(step):
+    """ Return the unit circle coordinates and the triangle fan indices for an angle step """
+    table = circle_tables.get(step)
+    if table is None:
+        angles = np.radians(np.arange(0, 360, step))
+        unit = np.column_stack((np.cos(angles), np.sin(angles)))
 
-    # Find the intersection of a line going thru each vertex and the infinite plane
-    for vert in verts:
-        vec = region_2d_to_vector_3d(region, rv3d, vert)
-        p0 = region_2d_to_location_3d(region, rv3d, vert, vec)
-        p1 = p0 + plane_direction * far_limit
-        loc0 = intersect_line_plane(p0, p1, plane_point, plane_direction)
-        t_v0 = bm.verts.new(loc0)
-        FacesList.append(t_v0)
+        # Fan around the center vertex (0), the last triangle closes on the first circle vertex
+        idx = np.arange(len(unit))
+        fan = np.column_stack((np.zeros_like(idx), idx + 1, (idx + 1) % len(unit) + 1))
+        indices = [tuple(tri) for tri in fan.tolist()]
 
-    bm.verts.index_update()
-    bm.faces.new(FacesList)
-    bm.to_mesh(me)
+        table = (unit, indices)
+        circle_tables[step] = table
+    return table
 
 
 def create_2d_circle(self, step, radius, rotation=0):
     """ Create the vertices of a 2d circle at (0,0) """
-    verts = []
-    for angle in range(0, 360, step):
-        verts.append(math.cos(math.radians(angle + rotation)) * radius)
-        verts.append(math.sin(math.radians(angle + rotation)) * radius)
-        verts.append(0.0)
-    verts.append(math.cos(math.radians(0.0 + rotation)) * radius)
-    verts.append(math.sin(math.radians(0.0 + rotation)) * radius)
-    verts.append(0.0)
-    return(verts)
+    unit, indices = get_circle_table(step)
+    angle = math.radians(rotation)
+    rot = np.array(((cos(angle), sin(angle)), (-sin(angle), cos(angle))))
+    return unit @ (rot * radius)
 
 
 def draw_circle(self, mouse_pos_x, mouse_pos_y):
     """ Return the coordinates + indices of a circle using a triangle fan """
-    tris_verts = []
-    indices = []
-    segments = int(360 / self.stepAngle[self.step])
+    step = self.stepAngle[self.step]
     radius = self.mouse_path[1][0] - self.mouse_path[0][0]
     rotation = (self.mouse_path[1][1] - self.mouse_path[0][1]) / 2
 
     # Get the vertices of a 2d circle
-    verts = create_2d_circle(self, self.stepAngle[self.step], radius, rotation)
+    verts = create_2d_circle(self, step, radius, rotation)
+    indices = get_circle_table(step)[1]
 
-    # Create the first vertex at mouse position for the center of the circle
-    tris_verts.append(Vector((mouse_pos_x + self.xpos, mouse_pos_y + self.ypos)))
-
-    # For each vertex of the circle, add the mouse position and the translation
-    for idx in range(int(len(verts) / 3) - 1):
-        tris_verts.append(Vector((verts[idx * 3] + mouse_pos_x + self.xpos,
-                                  verts[idx * 3 + 1] + mouse_pos_y + self.ypos)))
-        i1 = idx+1
-        i2 = idx+2 if idx+2 <= segments else 1
-        indices.append((0, i1, i2))
+    # The first vertex is the center of the circle, add the mouse position and the translation
+    tris_verts = np.empty((len(verts) + 1, 2), dtype=np.float32)
+    tris_verts[0] = (0.0, 0.0)
+    tris_verts[1:] = verts
+    tris_verts += (mouse_pos_x + self.xpos, mouse_pos_y + self.ypos)
 
     return(tris_verts, indices)
 
@@ -241,235 +764,951 @@ def objDiagonal(obj):
     return ((obj.dimensions[0]**2) + (obj.dimensions[1]**2) + (obj.dimensions[2]**2))**0.5
 
 
-def update_bevel(context):
-    """Bevel Update"""
-    selection = context.selected_objects.copy()
-    active = context.active_object
+def world_corners(obj):
+    """ World space corners (8, 3) of the bounding box of an object """
+    mat = np.array(obj.matrix_world)
+    return np.array(obj.bound_box) @ mat[:3, :3].T + mat[:3, 3]
 
-    if len(selection) > 0:
-        for obj in selection:
-            bpy.ops.object.select_all(action='DESELECT')
-            obj.select_set(True)
-            context.view_layer.objects.active = obj
 
-            # Test object name
-            # Subdive mode : Only bevel weight
-            if obj.data.name.startswith("S_") or obj.data.name.startswith("S "):
-                bpy.ops.object.mode_set(mode='EDIT')
-                bpy.ops.mesh.region_to_loop()
-                bpy.ops.transform.edge_bevelweight(value=1)
-                bpy.ops.object.mode_set(mode='OBJECT')
+def world_bounds(obj):
+    """ World space axis aligned bounding box (min, max) of an object """
+    corners = world_corners(obj)
+    return corners.min(axis=0), corners.max(axis=0)
 
-            else:
-                # No subdiv mode : bevel weight + Crease + Sharp
-                CreateBevel(context, obj)
 
-    bpy.ops.object.select_all(action='DESELECT')
+def get_cutter_depth(self, objects, margin=0.02, point=None, direction=None):
+    """ Return the near and far offsets of the cutter along the view direction
 
-    for obj in selection:
-        obj.select_set(True)
-    context.view_layer.objects.active = active
+    The offsets are fitted on the bounding boxes of the objects projected on the view direction,
+    plus a small margin. With the cursor depth, the cutter stops on the cut plane.
+    A copy of the cutter gives its own point and direction.
+    """
+    if direction is None:
+        direction = np.array(self.ViewVector.normalized())
+    if point is None:
+        point = self.cutter_coords[0]
+    corners = np.concatenate([world_corners(obj) for obj in objects])
+    dist = (corners - point) @ direction
+    near, far = dist.min(), dist.max()
+    pad = max((far - near) * margin, 1e-3)
 
+    if self.snapCursor:
+        return min(near, 0.0) - pad, 0.0
+    return near - pad, far + pad
+
+
+def mesh_arrays(me):
+    """ Return the vertex coordinates (n, 3) and the faces (as lists of vertex indices) of a mesh """
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    loops = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loops)
+    starts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", starts)
+    faces = np.split(loops, starts[1:]) if len(starts) else []
+    return co.reshape(-1, 3), [f.tolist() for f in faces]
+
+
+def cutter_world_arrays(cutter):
+    """ Return the world coordinates (n, 3) and the faces of the cutter """
+    # The cutter was just built, its world matrix and bounding box may not be updated yet
+    cutter_matrix = cutter.matrix_basis if cutter.parent is None else cutter.matrix_world
+    co, faces = mesh_arrays(cutter.data)
+    mat = np.array(cutter_matrix)
+    return co @ mat[:3, :3].T + mat[:3, 3], faces
 
-def CreateBevel(context, CurrentObject):
-    """Create bevel"""
-    # Save active object
-    SavActive = context.active_object
 
-    # Test if initial object has bevel
-    bevel_modifier = False
-    for modifier in SavActive.modifiers:
-        if modifier.name == 'Bevel':
-            bevel_modifier = True
+def vertex_islands(me):
+    """ Return one vertex index by connected part of a mesh """
+    edges = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    edges = edges.reshape(-1, 2)
+
+    # Union find on arrays : the root of the higher index is hooked on the lower one,
+    # then the paths are compressed, until both ends of all the edges have the same root
+    labels = np.arange(len(me.vertices))
+    while True:
+        a = labels[edges[:, 0]]
+        b = labels[edges[:, 1]]
+        split = a != b
+        if not split.any():
+            break
+        np.minimum.at(labels, np.maximum(a, b)[split], np.minimum(a, b)[split])
+        while True:
+            roots = labels[labels]
+            if np.array_equal(roots, labels):
+                break
+            labels = roots
+
+    return np.unique(labels)
+
+
+def mesh_changed(self, me):
+    """ Count a change of the mesh geometry written by the operator (cut, undo) """
+    key = me.as_pointer()
+    self.mesh_generation[key] = self.mesh_generation.get(key, 0) + 1
 
-    if bevel_modifier:
-        # Active "CurrentObject"
-        context.view_layer.objects.active = CurrentObject
 
-        bpy.ops.object.mode_set(mode='EDIT')
+def mesh_signature(self, me):
+    """ Cheap key of the mesh geometry : pointer, element counts, a few vertices and the count of changes """
+    verts = me.vertices
+    samples = tuple(tuple(verts[i].co) for i in sorted({0, len(verts) // 2, len(verts) - 1})) if len(verts) else ()
+    return (me.as_pointer(), len(verts), len(me.edges), len(me.polygons), samples,
+            self.mesh_generation.get(me.as_pointer(), 0))
 
-        # Edge mode
-        bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='EDGE')
-        # Clear all
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.mark_sharp(clear=True)
-        bpy.ops.transform.edge_crease(value=-1)
-        bpy.ops.transform.edge_bevelweight(value=-1)
 
-        bpy.ops.mesh.select_all(action='DESELECT')
+def get_target_bvh(self, obj):
+    """ Return the BVH tree, the vertex coordinates and the island vertices of the object mesh
+
+    They are cached for the operator session, by mesh, until the operator changes the mesh geometry.
+    """
+    me = obj.data
+    signature = mesh_signature(self, me)
+
+    cached = self.bvh_cache.get(me.as_pointer())
+    if cached is not None and cached[0] == signature:
+        return cached[1:]
+
+    co, faces = mesh_arrays(me)
+    bvh = BVHTree.FromPolygons(co.tolist(), faces)
+
+    cached = (signature, bvh, co, vertex_islands(me))
+    self.bvh_cache[me.as_pointer()] = cached
+    return cached[1:]
+
+
+def cutter_hits_object(self, cutter, obj):
+    """ Test if the cutter can change the object
 
-        # Select (in radians) all 30° sharp edges
-        bpy.ops.mesh.edges_select_sharp(sharpness=0.523599)
-        # Apply bevel weight + Crease + Sharp to the selected edges
-        bpy.ops.mesh.mark_sharp()
-        bpy.ops.transform.edge_crease(value=1)
-        bpy.ops.transform.edge_bevelweight(value=1)
+    The world bounding boxes are compared first, then the surfaces with BVH trees.
+    Without surface overlap, each connected part of the object is either inside or outside
+    the cutter : one vertex by part is tested.
+    """
+    world_co, faces = cutter_world_arrays(cutter)
+
+    obj_min, obj_max = world_bounds(obj)
+    if np.any(world_co.min(axis=0) > obj_max) or np.any(obj_min > world_co.max(axis=0)):
+        return False
+
+    # Cutter in the object local space
+    mat = np.array(obj.matrix_world.inverted())
+    co = world_co @ mat[:3, :3].T + mat[:3, 3]
+    cutter_bvh = BVHTree.FromPolygons(co.tolist(), faces)
+
+    obj_bvh, obj_co, islands = get_target_bvh(self, obj)
+
+    if obj_bvh.overlap(cutter_bvh):
+        return True
+
+    # No surface overlap : look for a part of the object inside the cutter
+    obj_co = obj_co[islands]
+    inside_box = np.all((obj_co >= co.min(axis=0)) & (obj_co <= co.max(axis=0)), axis=1)
+
+    for p in obj_co[inside_box]:
+        p = Vector(p)
+        location, normal, index, dist = cutter_bvh.find_nearest(p)
+        if location is not None and (location - p).dot(normal) > 0.0:
+            return True
+
+    return False
+
+
+def edge_face_adjacency(me, edge_mask=None):
+    """ Return the face of each loop, the number of faces of each edge and its first two faces (-1 if none)
 
-        bpy.ops.mesh.select_all(action='DESELECT')
+    With edge_mask, only the faces of the masked edges are looked up.
+    """
+    loop_edges = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("edge_index", loop_edges)
+    loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    loop_faces = np.repeat(np.arange(len(me.polygons), dtype=np.int32), loop_totals)
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+    edges, faces = loop_edges, loop_faces
+    if edge_mask is not None:
+        keep = edge_mask[loop_edges]
+        edges, faces = loop_edges[keep], loop_faces[keep]
 
-        CurrentObject.data.use_customdata_edge_bevel = True
+    # Faces sorted by edge, each edge starts at the sum of the face counts of the previous edges
+    order = np.argsort(edges, kind='stable')
+    edge_faces = faces[order]
+    count = np.bincount(edges, minlength=len(me.edges))
+    starts = np.cumsum(count) - count
 
-        for i in range(len(CurrentObject.data.edges)):
-            if CurrentObject.data.edges[i].select is True:
-                CurrentObject.data.edges[i].bevel_weight = 1.0
-                CurrentObject.data.edges[i].use_edge_sharp = True
+    if len(edge_faces) == 0:
+        no_face = np.full(len(me.edges), -1, dtype=np.int32)
+        return loop_edges, loop_faces, count, no_face, no_face
 
-        bevel_modifier = False
-        for m in CurrentObject.modifiers:
-            if m.name == 'Bevel':
-                bevel_modifier = True
+    last = len(edge_faces) - 1
+    face_a = np.where(count > 0, edge_faces[np.minimum(starts, last)], -1)
+    face_b = np.where(count > 1, edge_faces[np.minimum(starts + 1, last)], -1)
 
-        if bevel_modifier is False:
-            bpy.ops.object.modifier_add(type='BEVEL')
-            mod = context.object.modifiers[-1]
-            mod.limit_method = 'WEIGHT'
-            mod.width = 0.01
-            mod.profile = 0.699099
-            mod.use_clight_overlap = False
-            mod.segments = 3
-            mod.loop_slide = False
+    return loop_edges, loop_faces, count, face_a, face_b
 
-        bpy.ops.object.shade_smooth()
 
-        context.object.data.use_auto_smooth = True
-        context.object.data.auto_smooth_angle = 1.0471975
+def get_cut_region(me):
+    """ Return the masks of the faces and the edges around the faces created by the cut
 
-        # Restore the active object
-        context.view_layer.objects.active = SavActive
+    The new faces come from the cutter and are the only selected ones, the region is
+    these faces plus all the faces sharing a vertex with them.
+    """
+    selected = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("select", selected)
 
+    loop_verts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    loop_edges = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("edge_index", loop_edges)
+    loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    loop_faces = np.repeat(np.arange(len(me.polygons), dtype=np.int32), loop_totals)
 
-def UndoAdd(self, type, obj):
-    """ Create a backup mesh before apply the action to the object """
+    # One ring of faces around the vertices of the new faces
+    region_verts = np.zeros(len(me.vertices), dtype=bool)
+    region_verts[loop_verts[selected[loop_faces]]] = True
+    region_faces = np.zeros(len(me.polygons), dtype=bool)
+    region_faces[loop_faces[region_verts[loop_verts]]] = True
+
+    region_edges = np.zeros(len(me.edges), dtype=bool)
+    region_edges[loop_edges[region_faces[loop_faces]]] = True
+
+    return region_faces, region_edges
+
+
+def get_sharp_edges(me, sharpness, edge_mask=None):
+    """ Return the mask of the edges between two faces with an angle above sharpness (in radians) """
+    loop_edges, loop_faces, count, face_a, face_b = edge_face_adjacency(me, edge_mask)
+
+    if hasattr(me, "calc_normals"):
+        me.calc_normals()
+    normals = np.empty(len(me.polygons) * 3, dtype=np.float32)
+    me.polygons.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3)
+
+    # Like edges_select_sharp, only the edges with exactly two faces
+    sharp = count == 2
+    if edge_mask is not None:
+        sharp &= edge_mask
+    dot = np.einsum('ij,ij->i', normals[face_a[sharp]], normals[face_b[sharp]])
+    sharp[sharp] = dot < math.cos(sharpness)
+    return sharp
+
+
+def subdiv_bevel(obj):
+    """ Set the bevel weight on the border of the selected faces (new faces of the cut) """
+    me = obj.data
+
+    selected = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("select", selected)
+    if not selected.any():
+        return
+
+    # Only the edges of the selected faces
+    loop_edges = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("edge_index", loop_edges)
+    loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    edge_mask = np.zeros(len(me.edges), dtype=bool)
+    edge_mask[loop_edges[np.repeat(selected, loop_totals)]] = True
+
+    loop_edges, loop_faces, count, face_a, face_b = edge_face_adjacency(me, edge_mask)
+    selected_count = np.bincount(loop_edges, weights=selected[loop_faces], minlength=len(me.edges))
+
+    # Like region_to_loop : edges of the selected faces next to an unselected face or on the mesh border
+    border = (selected_count > 0) & ((selected_count < count) | (count == 1))
+
+    me.use_customdata_edge_bevel = True
+    weights = np.empty(len(me.edges), dtype=np.float32)
+    me.edges.foreach_get("bevel_weight", weights)
+    weights[border] = 1.0
+    me.edges.foreach_set("bevel_weight", weights)
+    me.update()
+
+
+def update_bevel(context, objects=None, beveled=None):
+    """Bevel Update, beveled is the set of meshes already updated in the session"""
+    selection = context.selected_objects.copy() if objects is None else list(objects)
+
+    with profiler.phase("bevel_update", objects=len(selection)):
+        for obj in selection:
+            # Test object name
+            # Subdive mode : Only bevel weight
+            if obj.data.name.startswith("S_") or obj.data.name.startswith("S "):
+                subdiv_bevel(obj)
+
+            else:
+                # No subdiv mode : bevel weight + Crease + Sharp
+                CreateBevel(context, obj, beveled)
+
+
+def CreateBevel(context, CurrentObject, beveled=None):
+    """Create bevel
+
+    The first time in the session the whole mesh is updated, then only the region created by the cut.
+    The meshes already updated are kept in the beveled set, without it the whole mesh is updated.
+    """
+    # Test if initial object has bevel
+    if CurrentObject.modifiers.get('Bevel') is None:
+        return
+
+    me = CurrentObject.data
+    me.use_customdata_edge_bevel = True
+    me.use_customdata_edge_crease = True
+
+    if beveled is not None and me.as_pointer() in beveled:
+        region_faces, region_edges = get_cut_region(me)
+        if not region_faces.any():
+            return
+    else:
+        region_faces = np.ones(len(me.polygons), dtype=bool)
+        region_edges = np.ones(len(me.edges), dtype=bool)
+
+    # Apply bevel weight + Crease + Sharp to the 30° sharp edges of the region, clear the others
+    sharp = get_sharp_edges(me, 0.523599, region_edges)
+    use_sharp = np.empty(len(me.edges), dtype=bool)
+    me.edges.foreach_get("use_edge_sharp", use_sharp)
+    use_sharp[region_edges] = sharp[region_edges]
+    me.edges.foreach_set("use_edge_sharp", use_sharp)
+
+    for attr in ("crease", "bevel_weight"):
+        values = np.empty(len(me.edges), dtype=np.float32)
+        me.edges.foreach_get(attr, values)
+        values[region_edges] = sharp[region_edges]
+        me.edges.foreach_set(attr, values)
+
+    # Shade smooth
+    smooth = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("use_smooth", smooth)
+    smooth[region_faces] = True
+    me.polygons.foreach_set("use_smooth", smooth)
+    me.use_auto_smooth = True
+    me.auto_smooth_angle = 1.0471975
+
+    if beveled is not None:
+        beveled.add(me.as_pointer())
+    set_mesh_selection(me, False)
+    me.update()
+
+
+class MeshSnapshot:
+    """ Compact copy of a mesh geometry stored as arrays, optionally compressed
+
+    The deform weights and the custom split normals can not be read as arrays,
+    a mesh with them is kept as a full bmesh copy.
+    """
+
+    # (key, collection, attribute, dtype, item size, mesh flag needed to write the attribute)
+    layout = (
+        ("co", "vertices", "co", np.float32, 3, None),
+        ("edge_verts", "edges", "vertices", np.int32, 2, None),
+        ("sharp", "edges", "use_edge_sharp", bool, 1, None),
+        ("seam", "edges", "use_seam", bool, 1, None),
+        ("crease", "edges", "crease", np.float32, 1, "use_customdata_edge_crease"),
+        ("bevel_weight", "edges", "bevel_weight", np.float32, 1, "use_customdata_edge_bevel"),
+        ("loop_verts", "loops", "vertex_index", np.int32, 1, None),
+        ("loop_edges", "loops", "edge_index", np.int32, 1, None),
+        ("loop_start", "polygons", "loop_start", np.int32, 1, None),
+        ("loop_total", "polygons", "loop_total", np.int32, 1, None),
+        ("material", "polygons", "material_index", np.int32, 1, None),
+        ("smooth", "polygons", "use_smooth", bool, 1, None),
+    )
+
+    # (layer collection, attribute, item size) of the loop layers
+    loop_layouts = (
+        ("uv_layers", "uv", 2),
+        ("vertex_colors", "color", 4),
+    )
+
+    flags = (
+        "use_customdata_edge_bevel",
+        "use_customdata_edge_crease",
+        "use_auto_smooth",
+        "auto_smooth_angle",
+    )
+
+    # Estimated bytes by element of a bmesh copy (element, links and custom data)
+    bmesh_sizes = {"vertices": 80, "edges": 96, "loops": 80, "polygons": 80}
+
+    def __init__(self, me, full_copy=False):
+        self.compress = False
+        self.counts = {name: len(getattr(me, name)) for name in ("vertices", "edges", "loops", "polygons")}
+        self.mesh_flags = {flag: getattr(me, flag) for flag in self.flags}
+        self.arrays = {}
+        # (layer collection, name, array) of the uv and color layers
+        self.loop_layers = []
+        self.bm = None
+
+        if full_copy:
+            # Full copy instead of the arrays, never shared
+            self.bm = bmesh.new()
+            self.bm.from_mesh(me)
+            self.copy_bytes = sum(count * self.bmesh_sizes[name] for name, count in self.counts.items())
+            self.fingerprint = mesh_fingerprint(me)
+            self.digest = hashlib.blake2b(str(id(self.bm)).encode(), digest_size=16).digest()
+            return
+
+        for key, collection, attr, dtype, size, flag in self.layout:
+            data = np.empty(self.counts[collection] * size, dtype=dtype)
+            getattr(me, collection).foreach_get(attr, data)
+            self.arrays[key] = (data.dtype, data)
+
+        for layers, attr, size in self.loop_layouts:
+            for layer in getattr(me, layers):
+                data = np.empty(self.counts["loops"] * size, dtype=np.float32)
+                layer.data.foreach_get(attr, data)
+                self.loop_layers.append((layers, layer.name, (data.dtype, data)))
+
+        # Geometry only key, to test if the mesh was changed
+        self.fingerprint = mesh_fingerprint(me, self.arrays["co"][1], self.arrays["loop_verts"][1])
+
+        # Full content key, to share identical snapshots
+        items = list(self.arrays.values()) + [item for layers, name, item in self.loop_layers]
+        digest = hashlib.blake2b(digest_size=16)
+        for dtype, data in items:
+            digest.update(data.tobytes())
+        for layers, name, item in self.loop_layers:
+            digest.update((layers + name).encode())
+        digest.update(repr(sorted(self.mesh_flags.items())).encode())
+        self.digest = digest.digest()
+
+    def pack(self, compress):
+        """ Compress the stored arrays if asked """
+        if compress and not self.compress:
+            self.arrays = {key: (dtype, zlib.compress(data.tobytes(), 1))
+                           for key, (dtype, data) in self.arrays.items()}
+            self.loop_layers = [(layers, name, (dtype, zlib.compress(data.tobytes(), 1)))
+                                for layers, name, (dtype, data) in self.loop_layers]
+            self.compress = True
+
+    def unpack(self, item):
+        """ Get back a stored array """
+        dtype, data = item
+        if self.compress:
+            return np.frombuffer(zlib.decompress(data), dtype=dtype)
+        return data
+
+    @property
+    def nbytes(self):
+        """ Memory used by the stored arrays, estimated from the element counts for a full copy """
+        if self.bm is not None:
+            return self.copy_bytes
+        items = list(self.arrays.values()) + [item for layers, name, item in self.loop_layers]
+        return sum(len(data) if self.compress else data.nbytes for dtype, data in items)
+
+    def restore(self, me):
+        """ Rebuild the mesh from the stored arrays """
+        if self.bm is not None:
+            self.bm.to_mesh(me)
+            me.update()
+            return
+
+        clear_mesh(me)
+        for flag, value in self.mesh_flags.items():
+            setattr(me, flag, value)
+
+        for collection, count in self.counts.items():
+            getattr(me, collection).add(count)
+
+        for key, collection, attr, dtype, size, flag in self.layout:
+            if flag is None or self.mesh_flags[flag]:
+                getattr(me, collection).foreach_set(attr, self.unpack(self.arrays[key]))
+
+        attrs = {layers: attr for layers, attr, size in self.loop_layouts}
+        for layers, name, item in self.loop_layers:
+            layer = getattr(me, layers).new(name=name)
+            layer.data.foreach_set(attrs[layers], self.unpack(item))
+
+        me.update()
+
+
+def mesh_fingerprint(me, co=None, loop_verts=None):
+    """ Element counts and hash of the coordinates and faces of a mesh """
+    if co is None:
+        co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+        me.vertices.foreach_get("co", co)
+    if loop_verts is None:
+        loop_verts = np.empty(len(me.loops), dtype=np.int32)
+        me.loops.foreach_get("vertex_index", loop_verts)
+
+    digest = hashlib.blake2b(co.tobytes(), digest_size=16)
+    digest.update(loop_verts.tobytes())
+    return (len(me.vertices), len(me.edges), len(me.polygons), digest.digest())
+
+
+def UndoAdd(self, type, obj, targets=()):
+    """ Create a backup mesh before apply the action to the object
+
+    A LIVE entry is a cutter left in the scene with its booleans on the targets.
+    """
     if obj is None:
         return
 
-    if type != "DUPLICATE":
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
-        self.UndoOps.append((obj, type, bm))
+    if type == "MESH":
+        with profiler.phase("undo_snapshot", target=obj.name, faces=len(obj.data.polygons)):
+            # Identical snapshots share the same stored copy
+            # The vertex groups weights and custom normals need a full copy
+            full_copy = len(obj.vertex_groups) > 0 or obj.data.has_custom_normals
+            snapshot = MeshSnapshot(obj.data, full_copy)
+            shared = self.UndoPool.get(snapshot.digest)
+            if shared is None:
+                snapshot.pack(self.undo_compress)
+                self.UndoPool[snapshot.digest] = snapshot
+            else:
+                snapshot = shared
+        self.UndoOps.append((obj, type, snapshot))
+    elif type == "LIVE":
+        self.UndoOps.append((obj, type, list(targets)))
     else:
         self.UndoOps.append((obj, type, None))
 
 
+def UndoDiscardUnchanged(self):
+    """ Remove the backups of the objects the action did not change """
+    self.UndoOps[:] = [o for o in self.UndoOps
+                       if o[1] != "MESH" or mesh_fingerprint(o[0].data) != o[2].fingerprint]
+    UndoPoolUpdate(self)
+
+
+def UndoPoolUpdate(self):
+    """ Free the shared snapshots no longer used by an undo step """
+    used = {o[2].digest for ops in self.UList + [self.UndoOps] for o in ops if o[1] == "MESH"}
+    for digest in list(self.UndoPool):
+        if digest not in used:
+            del self.UndoPool[digest]
+
+
+def UndoSize(self):
+    """ Memory used by the undo steps """
+    return sum(snapshot.nbytes for snapshot in self.UndoPool.values())
+
+
 def UndoListUpdate(self):
+    # Nothing was changed
+    if not self.UndoOps:
+        return
+
     self.UList.append((self.UndoOps.copy()))
     self.UList_Index += 1
     self.UndoOps.clear()
 
+    # Free the oldest steps when the memory budget is exceeded
+    budget = self.undo_memory_limit * 1024 * 1024
+    while len(self.UList) > 1 and UndoSize(self) > budget:
+        self.UList.pop(0)
+        self.UList_Index -= 1
+        UndoPoolUpdate(self)
+
 
 def Undo(self):
     if self.UList_Index < 0:
         return
-    # get previous mesh
-    for o in self.UList[self.UList_Index]:
-        if o[1] == "MESH":
-            bm = o[2]
-            bm.to_mesh(o[0].data)
 
-    SelectObjList = bpy.context.selected_objects.copy()
-    Active_Obj = bpy.context.active_object
-    bpy.ops.object.select_all(action='TOGGLE')
+    with profiler.phase("Undo", summary=True):
+        # get previous mesh
+        with profiler.phase("undo_restore"):
+            for o in self.UList[self.UList_Index]:
+                if o[1] == "MESH":
+                    o[2].restore(o[0].data)
+                    mesh_changed(self, o[0].data)
+
+                # Remove the live booleans of a deferred cutter
+                if o[1] == "DEFERRED":
+                    for i, (cutter, targets) in enumerate(self.apply_queue):
+                        if cutter == o[0]:
+                            for obj in targets:
+                                mod = obj.modifiers.get("CT_" + cutter.name)
+                                if mod is not None:
+                                    obj.modifiers.remove(mod)
+                            del self.apply_queue[i]
+                            break
+                    # The cutter goes back to the pool
+                    self.cutter_pool.release(o[0])
+
+                # Remove the booleans of a cutter left in the scene, the cutter is removed below
+                if o[1] == "LIVE":
+                    for obj in o[2]:
+                        for mod in [m for m in obj.modifiers if m.type == 'BOOLEAN' and
+                                    m.name.startswith("CT_") and m.object == o[0]]:
+                            obj.modifiers.remove(mod)
+
+        # Remove the created objects, the selection of the other objects is kept
+        with profiler.phase("remove_objects"):
+            for o in self.UList[self.UList_Index]:
+                if o[1] in ("REBOOL", "DUPLICATE", "LIVE"):
+                    remove_object(o[0])
+
+        self.UList_Index -= 1
+        self.UList[self.UList_Index + 1:] = []
+        UndoPoolUpdate(self)
+
+
+def set_mesh_selection(me, select):
+    """ Select or deselect all the vertices, edges and faces of a mesh """
+    for elements in (me.vertices, me.edges, me.polygons):
+        elements.foreach_set("select", np.full(len(elements), select, dtype=bool))
+
+
+def move_modifier_after_cutters(obj, mod_name):
+    """ Move a modifier on top of the stack, after the cutter booleans already there (cut order) """
+    index = 0
+    for mod in obj.modifiers:
+        if mod.name == mod_name or not mod.name.startswith("CT_"):
+            break
+        index += 1
+
+    if hasattr(obj.modifiers, "move"):
+        obj.modifiers.move(obj.modifiers.find(mod_name), index)
+    else:
+        override = {'object': obj}
+        while obj.modifiers.find(mod_name) > index:
+            bpy.ops.object.modifier_move_up(override, modifier=mod_name)
+
+
+# Estimated cost above which the fast solver is used first
+exact_solver_cost = 250000
+
+
+def boolean_cost(obj, cutter):
+    """ Estimate the cost of a boolean from the face counts and the overlap of the bounding boxes """
+    cutter_co, faces = cutter_world_arrays(cutter)
+    obj_min, obj_max = world_bounds(obj)
+    size = np.maximum(obj_max - obj_min, 1e-6)
+    common = np.minimum(obj_max, cutter_co.max(axis=0)) - np.maximum(obj_min, cutter_co.min(axis=0))
+    overlap = float(np.prod(np.clip(common, 0.0, None) / size))
+
+    # Every face is read by the solver, the faces in the overlap are intersected
+    return len(obj.data.polygons) * (0.25 + overlap) + len(faces)
 
-    for o in self.UList[self.UList_Index]:
-        if o[1] == "REBOOL":
-            o[0].select_set(True)
-            o[0].hide_viewport = False
 
-        if o[1] == "DUPLICATE":
-            o[0].select_set(True)
-            o[0].hide_viewport = False
+def choose_boolean_strategy(obj, cutter, self_intersect=False):
+    """ Return the solver and its options for a boolean of the object by the cutter
 
-    bpy.ops.object.delete(use_global=False)
+    self_intersect is used when the parts of the cutter overlap and could not be merged :
+    the fast solver can not handle them, the exact solver is used whatever the cost.
+    """
+    cost = boolean_cost(obj, cutter)
+    return {
+        "cost": cost,
+        "solver": 'EXACT' if cost < exact_solver_cost or self_intersect else 'FAST',
+        "use_self": self_intersect,
+        # Overlap threshold of the fast solver, relative to the object size
+        "double_threshold": max(1e-6, objDiagonal(obj) * 1e-7),
+    }
 
-    for so in SelectObjList:
-        bpy.data.objects[so.name].select_set(True)
-    bpy.context.view_layer.objects.active = Active_Obj
 
-    self.UList_Index -= 1
-    self.UList[self.UList_Index + 1:] = []
+def set_boolean_strategy(mod, strategy):
+    """ Set the solver options of a boolean modifier, if the Blender version has them """
+    for attr in ("solver", "use_self", "double_threshold"):
+        if hasattr(mod, attr):
+            setattr(mod, attr, strategy[attr])
 
 
-def boolean_operation(bool_type="DIFFERENCE"):
-    ActiveObj = bpy.context.active_object
-    sel_index = 0 if bpy.context.selected_objects[0] != bpy.context.active_object else 1
+def switch_boolean_solver(mod):
+    """ Use the other solver for a boolean modifier, return False if there is only one solver """
+    if not hasattr(mod, "solver"):
+        return False
+    mod.solver = 'FAST' if mod.solver == 'EXACT' else 'EXACT'
+    if hasattr(mod, "use_self"):
+        mod.use_self = mod.solver == 'EXACT'
+    return True
 
-    # bpy.ops.object.modifier_apply(apply_as='DATA', modifier="CT_SOLIDIFY")
-    bool_name = "CT_" + bpy.context.selected_objects[sel_index].name
-    BoolMod = ActiveObj.modifiers.new(bool_name, "BOOLEAN")
-    BoolMod.object = bpy.context.selected_objects[sel_index]
+
+def boolean_solver_name(mod):
+    return mod.solver if hasattr(mod, "solver") else "DEFAULT"
+
+
+def boolean_operation(obj, cutter, bool_type="DIFFERENCE", self_intersect=False):
+    """ Add a boolean modifier using the cutter on top of the object stack, after the previous cutters """
+    bool_name = "CT_" + cutter.name
+    BoolMod = obj.modifiers.new(bool_name, "BOOLEAN")
+    BoolMod.object = cutter
     BoolMod.operation = bool_type
-    bpy.context.selected_objects[sel_index].display_type = 'WIRE'
-    while ActiveObj.modifiers.find(bool_name) > 0:
-        bpy.ops.object.modifier_move_up(modifier=bool_name)
 
+    strategy = choose_boolean_strategy(obj, cutter, self_intersect)
+    set_boolean_strategy(BoolMod, strategy)
+    logger.info("%s : %s %s (cost %d)", obj.name, bool_type, boolean_solver_name(BoolMod), strategy["cost"])
+
+    cutter.display_type = 'WIRE'
+    move_modifier_after_cutters(obj, bool_name)
+    return BoolMod
+
+
+def union_cutter(self, context, cutter):
+    """ Merge the overlapping parts of a cutter made of several shapes
+
+    Needs the exact solver with self intersection. Return False if the Blender version has not,
+    or if the union failed : the cutter is then left as it was.
+    """
+    mod = cutter.modifiers.new("CT_UNION", "BOOLEAN")
+    if not (hasattr(mod, "solver") and hasattr(mod, "operand_type")):
+        cutter.modifiers.remove(mod)
+        return False
+
+    # Union of the mesh with itself only, thru an empty operand
+    mod.operation = 'UNION'
+    mod.operand_type = 'COLLECTION'
+    mod.solver = 'EXACT'
+    mod.use_self = True
+    with profiler.phase("union", faces=len(cutter.data.polygons)):
+        depsgraph = context.evaluated_depsgraph_get()
+        merged = write_evaluated_mesh(self, cutter, depsgraph)
+    cutter.modifiers.remove(mod)
+    return merged
+
+
+def non_manifold_edges(me):
+    """ Number of edges not used by exactly two faces """
+    loop_edges = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("edge_index", loop_edges)
+    return int(np.count_nonzero(np.bincount(loop_edges, minlength=len(me.edges)) != 2))
+
+
+def write_evaluated_mesh(self, obj, depsgraph, check=True, me=None, manifold=False):
+    """ Write the evaluated mesh of the object to its data, or to the mesh me
+
+    With check, an empty result (of an object with faces) or a result with invalid coordinates
+    is not written. With manifold, the result of a closed object must be closed too
+    (the fast solver can give a wrong result on coplanar faces).
+    Return False if the evaluation failed or the result was not written.
+    """
+    had_faces = len(obj.data.polygons) > 0
+    was_closed = manifold and check and had_faces and non_manifold_edges(obj.data) == 0
+    if me is None:
+        me = obj.data
+    obj_eval = obj.evaluated_get(depsgraph)
+    try:
+        me_eval = obj_eval.to_mesh()
+        valid = True
+        if check:
+            co = np.empty(len(me_eval.vertices) * 3, dtype=np.float32)
+            me_eval.vertices.foreach_get("co", co)
+            valid = (len(me_eval.polygons) > 0 or not had_faces) and bool(np.isfinite(co).all())
+            if valid and was_closed:
+                valid = non_manifold_edges(me_eval) == 0
+        if valid:
+            bm = bmesh.new()
+            bm.from_mesh(me_eval)
+            bm.to_mesh(me)
+            bm.free()
+            me.update()
+            mesh_changed(self, me)
+    except Exception:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        self.report({'ERROR'}, str(exc_value))
+        valid = False
+    finally:
+        obj_eval.to_mesh_clear()
+    return valid
+
+
+def new_mesh_like(me):
+    """ New empty mesh with the name, materials and smoothing of a mesh """
+    new_me = bpy.data.meshes.new(me.name)
+    for mat in me.materials:
+        new_me.materials.append(mat)
+    if hasattr(me, "use_auto_smooth"):
+        new_me.use_auto_smooth = me.use_auto_smooth
+        new_me.auto_smooth_angle = me.auto_smooth_angle
+    return new_me
+
+
+def apply_modifiers(self, context, objects, mod_names, new_data=(), retry=True):
+    """ Apply modifiers of several objects from a single evaluation of the depsgraph
+
+    The objects of new_data get a new mesh, they can share their mesh with other objects of the list.
+    The booleans failing (error, empty or invalid result, or an open result of a closed object
+    with the fast solver) are evaluated again with the other solver, unless retry is off. The strategy and duration of each target are logged.
+    """
+    if isinstance(mod_names, str):
+        mod_names = (mod_names,)
+
+    # Like applying the first modifiers of the stack : only these modifiers are evaluated
+    hidden = []
+    for obj in objects:
+        for mod in obj.modifiers:
+            if mod.name not in mod_names and mod.show_viewport:
+                mod.show_viewport = False
+                hidden.append(mod)
+
+    start = time.perf_counter()
+    with profiler.phase("evaluate", objects=len(objects)):
+        depsgraph = context.evaluated_depsgraph_get()
+    evaluate_time = time.perf_counter() - start
+
+    # Write the evaluated meshes back to the object data, the new meshes first :
+    # a shared mesh is only changed once all the objects using it are evaluated
+    objects = [obj for obj in objects if obj in new_data] + [obj for obj in objects if obj not in new_data]
+    failed = []
+    failed_data = set()
+    for obj in objects:
+        mods = [mod for mod in obj.modifiers if mod.name in mod_names]
+        if not mods:
+            continue
+        # The object is evaluated again with the other solver, as the object sharing its mesh
+        if obj.data.as_pointer() in failed_data:
+            failed.append((obj, mods))
+            continue
+        # A failed boolean is tried again, unless there is no other solver to try
+        fallback = retry and all(hasattr(mod, "solver") for mod in mods if mod.type == 'BOOLEAN')
+        solvers = ", ".join(boolean_solver_name(mod) for mod in mods if mod.type == 'BOOLEAN')
+        # The results of the fast solver are also checked for holes
+        fast = any(boolean_solver_name(mod) == 'FAST' for mod in mods if mod.type == 'BOOLEAN')
+        me = new_mesh_like(obj.data) if obj in new_data else None
+        apply_start = time.perf_counter()
+        with profiler.phase("apply", target=obj.name, solver=solvers,
+                            faces_before=len(obj.data.polygons)) as args:
+            written = write_evaluated_mesh(self, obj, depsgraph, fallback, me, manifold=fast)
+            if not written and fallback:
+                failed.append((obj, mods))
+                failed_data.add(obj.data.as_pointer())
+                if me is not None:
+                    bpy.data.meshes.remove(me)
+            elif me is not None:
+                obj.data = me
+            args["faces_after"] = len(obj.data.polygons)
+        logger.info("%s : %s %s in %.3fs (shared evaluation of %d objects %.3fs)",
+                    obj.name, solvers, "failed" if not written else "applied",
+                    time.perf_counter() - apply_start, len(objects), evaluate_time)
+
+    # Evaluate the failed objects again with the other solver
+    if failed:
+        start = time.perf_counter()
+        for obj, mods in failed:
+            for mod in mods:
+                if mod.type == 'BOOLEAN':
+                    switch_boolean_solver(mod)
+        with profiler.phase("evaluate_fallback", objects=len(failed)):
+            depsgraph = context.evaluated_depsgraph_get()
+        evaluate_time = time.perf_counter() - start
+        for obj, mods in failed:
+            solvers = ", ".join(boolean_solver_name(mod) for mod in mods if mod.type == 'BOOLEAN')
+            apply_start = time.perf_counter()
+            with profiler.phase("apply_fallback", target=obj.name, solver=solvers) as args:
+                # The result of the other solver is kept, even empty
+                me = new_mesh_like(obj.data) if obj in new_data else None
+                write_evaluated_mesh(self, obj, depsgraph, False, me)
+                if me is not None:
+                    obj.data = me
+                args["faces_after"] = len(obj.data.polygons)
+            logger.info("%s : fallback to %s in %.3fs (shared evaluation of %d objects %.3fs)",
+                        obj.name, solvers, time.perf_counter() - apply_start, len(failed), evaluate_time)
+
+    for obj in objects:
+        for mod in [mod for mod in obj.modifiers if mod.name in mod_names]:
+            obj.modifiers.remove(mod)
+
+    for mod in hidden:
+        mod.show_viewport = True
+
+
+def flush_apply_queue(self, context):
+    """ Apply all the booleans of the deferred cutters, one evaluation for all the targets """
+    if not self.apply_queue:
+        return
+
+    cutters = [cutter for cutter, targets in self.apply_queue]
+    targets = []
+    for cutter, cutter_targets in self.apply_queue:
+        for obj in cutter_targets:
+            if obj not in targets:
+                targets.append(obj)
 
-def Rebool(context, self):
+    for obj in targets:
+        UndoAdd(self, "MESH", obj)
 
-    target_obj = context.active_object
+    # Keep the faces created by the booleans selected for the bevel update
+    for cutter in cutters:
+        set_mesh_selection(cutter.data, True)
+    for obj in targets:
+        set_mesh_selection(obj.data, False)
 
-    Brush = context.selected_objects[1]
-    Brush.display_type = "WIRE"
+    # The stack order of the queued booleans is kept by the evaluation
+    apply_modifiers(self, context, targets, {"CT_" + cutter.name for cutter in cutters})
+
+    for cutter in cutters:
+        self.cutter_pool.release(cutter)
 
-    # Deselect all
-    bpy.ops.object.select_all(action='TOGGLE')
+    self.apply_queue.clear()
+    UndoDiscardUnchanged(self)
+    UndoListUpdate(self)
 
+    if self.Auto_BevelUpdate:
+        update_bevel(context, targets, self.beveled_meshes)
+
+
+def drop_apply_queue(self):
+    """ Remove the booleans of the deferred cutters without applying them """
+    for cutter, targets in self.apply_queue:
+        for obj in targets:
+            mod = obj.modifiers.get("CT_" + cutter.name)
+            if mod is not None:
+                obj.modifiers.remove(mod)
+        self.cutter_pool.release(cutter)
+    self.apply_queue.clear()
+
+
+def new_part_object(obj):
+    """ Copy of an object using its mesh, in the same collections
+
+    The object level state is kept : vertex groups, modifiers, constraints, material links,
+    visibility and place. The cutter booleans of the object are not copied.
+    """
+    part = obj.copy()
+    for coll in obj.users_collection:
+        coll.objects.link(part)
+    for mod in [mod for mod in part.modifiers if mod.name.startswith("CT_")]:
+        part.modifiers.remove(mod)
+    return part
+
+
+def Rebool(context, self, target_obj, Brush):
+    """ Split the target object with the cutter : the inside part goes to a new object
+
+    The new object is a copy of the target using its mesh, both parts are evaluated at once
+    and only the inside part gets a new mesh. The selection is not changed,
+    the new object is returned.
+    """
+    Brush.display_type = "WIRE"
     target_obj.display_type = "SOLID"
-    target_obj.select_set(True)
-    bpy.ops.object.duplicate()
 
-    rebool_obj = context.active_object
+    with profiler.phase("new_object", target=target_obj.name):
+        rebool_obj = new_part_object(target_obj)
+        # The live booleans need their own mesh
+        if self.dont_apply_boolean:
+            rebool_obj.data = target_obj.data.copy()
+
+    # Same solver for both parts, so the cut faces of the two parts match
+    strategy = choose_boolean_strategy(target_obj, Brush, self.cutter_self_intersect)
 
     m = rebool_obj.modifiers.new("CT_INTERSECT", "BOOLEAN")
     m.operation = "INTERSECT"
     m.object = Brush
+    set_boolean_strategy(m, strategy)
+    move_modifier_after_cutters(rebool_obj, "CT_INTERSECT")
 
     m = target_obj.modifiers.new("CT_DIFFERENCE", "BOOLEAN")
     m.operation = "DIFFERENCE"
     m.object = Brush
+    set_boolean_strategy(m, strategy)
+    move_modifier_after_cutters(target_obj, "CT_DIFFERENCE")
 
-    for mb in target_obj.modifiers:
-        if mb.type == 'BEVEL':
-            mb.show_viewport = False
+    logger.info("%s : REBOOL %s (cost %d)", target_obj.name, boolean_solver_name(m), strategy["cost"])
 
+    # Both parts from a single evaluation, the other modifiers are not applied
     if self.dont_apply_boolean is False:
-        try:
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier="CT_INTERSECT")
-        except:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            self.report({'ERROR'}, str(exc_value))
+        apply_modifiers(self, context, [rebool_obj, target_obj], ("CT_INTERSECT", "CT_DIFFERENCE"),
+                        new_data=[rebool_obj])
 
-    bpy.ops.object.select_all(action='TOGGLE')
-
-    for mb in target_obj.modifiers:
-        if mb.type == 'BEVEL':
-            mb.show_viewport = True
-
-    context.view_layer.objects.active = target_obj
-    target_obj.select_set(True)
-    if self.dont_apply_boolean is False:
-        try:
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier="CT_DIFFERENCE")
-        except:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            self.report({'ERROR'}, str(exc_value))
-
-    bpy.ops.object.select_all(action='TOGGLE')
-
-    rebool_obj.select_set(True)
+    return rebool_obj
 
 
 def Selection_Save_Restore(self):
-    if "CT_Profil" in bpy.data.objects:
-        Selection_Save(self)
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.data.objects["CT_Profil"].select_set(True)
-        bpy.context.view_layer.objects.active = bpy.data.objects["CT_Profil"]
-        if bpy.data.objects["CT_Profil"] in self.all_sel_obj_list:
-            self.all_sel_obj_list.remove(bpy.data.objects["CT_Profil"])
-        bpy.ops.object.delete(use_global=False)
-        Selection_Restore(self)
+    """ Remove the profile object, the selection of the other objects is kept """
+    profile = bpy.data.objects.get("CT_Profil")
+    if profile is not None:
+        if profile in self.all_sel_obj_list:
+            self.all_sel_obj_list.remove(profile)
+        remove_object(profile)
 
 
 def Selection_Save(self):
@@ -485,47 +1724,53 @@ def Selection_Restore(self):
         bpy.context.view_layer.objects.active = bpy.data.objects.get(self.save_active_obj, None)
 
 
+def snap_2d_points_to_grid(view, coords):
+    """ Snap an array of 2d coordinates on the overlay grid, return a (n, 2) array """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    origins, directions = get_view_rays(view, coords)
+
+    # 3d location of the points at the depth of the world origin
+    if view.is_perspective:
+        view_z = view.view_inv[:3, 2]
+        dist = -(origins @ view_z) / (directions @ view_z)
+    else:
+        dist = -np.einsum('ij,ij->i', origins, directions)
+    points = origins + directions * dist[:, None]
+
+    # Use the grid scale and subdivision to get the increment, round to the closest location on the grid
+    increment = view.grid_scale / view.grid_subdivisions
+    points = np.floor(points / increment + 0.5) * increment
+
+    # Get the snapped 2d location, points behind the view are not moved
+    prj = np.column_stack((points, np.ones(len(points)))) @ view.pers.T
+    visible = prj[:, 3] > 0.0
+    w = np.where(visible, prj[:, 3], 1.0)
+    snapped = np.empty_like(coords)
+    snapped[:, 0] = view.width / 2 * (1.0 + prj[:, 0] / w)
+    snapped[:, 1] = view.height / 2 * (1.0 + prj[:, 1] / w)
+    snapped[~visible] = coords[~visible]
+
+    return snapped
+
+
 def Snap_Cursor(self, context, event, mouse_pos):
     """ Find the closest position on the overlay grid and snap the mouse on it """
-    # Get the context arguments
-    region = context.region
-    rv3d = context.region_data
+    if len(self.mouse_path) == 0:
+        return
 
-    # Get the VIEW3D area
-    for i, a in enumerate(context.screen.areas):
-        if a.type == 'VIEW_3D':
-            space = context.screen.areas[i].spaces.active
-
-    # Get the grid overlay for the VIEW_3D
-    grid_scale = space.overlay.grid_scale
-    grid_subdivisions = space.overlay.grid_subdivisions
-
-    # Use the grid scale and subdivision to get the increment
-    increment = (grid_scale / grid_subdivisions)
-    half_increment = increment / 2
-
-    # Convert the 2d location of the mouse in 3d
-    for index, loc in enumerate(reversed(mouse_pos)):
-        mouse_loc_3d = region_2d_to_location_3d(region, rv3d, loc, (0, 0, 0))
-
-        # Get the remainder from the mouse location and the ratio
-        # Test if the remainder > to the half of the increment
-        for i in range(3):
-            modulo = mouse_loc_3d[i] % increment
-            if modulo < half_increment:
-                modulo = - modulo
-            else:
-                modulo = increment - modulo
+    # Replace the last mouse locations by the snapped locations
+    snapped = snap_2d_points_to_grid(get_view_context(self, context), mouse_pos)
+    count = min(len(snapped), len(self.mouse_path))
+    self.mouse_path[-count:] = [tuple(co) for co in snapped[-count:].tolist()]
 
-            # Add the remainder to get the closest location on the grid
-            mouse_loc_3d[i] = mouse_loc_3d[i] + modulo
 
-        # Get the snapped 2d location
-        snap_loc_2d = location_3d_to_region_2d(region, rv3d, mouse_loc_3d)
+def Snap_Path(self, context):
+    """ Snap all the points of the mouse path on the overlay grid """
+    if len(self.mouse_path) == 0:
+        return
 
-        # Replace the last mouse location by the snapped location
-        if len(self.mouse_path) > 0:
-            self.mouse_path[len(self.mouse_path) - (index + 1)] = tuple(snap_loc_2d)
+    snapped = snap_2d_points_to_grid(get_view_context(self, context), self.mouse_path)
+    self.mouse_path[:] = [tuple(co) for co in snapped.tolist()]
 
 
 def mini_grid(self, context, color):
@@ -535,16 +1780,14 @@ def mini_grid(self, context, color):
     rv3d = context.region_data
 
     # Get the VIEW3D area
-    for i, a in enumerate(context.screen.areas):
-        if a.type == 'VIEW_3D':
-            space = context.screen.areas[i].spaces.active
-            screen_height = context.screen.areas[i].height
-            screen_width = context.screen.areas[i].width
+    view = get_view_context(self, context)
+    screen_height = view.area_height
+    screen_width = view.area_width
 
     # Draw the snap grid, only in ortho view
-    if not space.region_3d.is_perspective:
-        grid_scale = space.overlay.grid_scale
-        grid_subdivisions = space.overlay.grid_subdivisions
+    if not view.is_perspective:
+        grid_scale = view.grid_scale
+        grid_subdivisions = view.grid_subdivisions
         increment = (grid_scale / grid_subdivisions)
 
         # Get the 3d location of the mouse forced to a snap value in the operator